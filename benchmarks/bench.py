@@ -0,0 +1,184 @@
+#! /usr/bin/env python3.5
+"""
+Benchmarks the downloader against a local imitation of the comics websites
+
+The mock server (see `mock_server`) is the HTTP proxy of the downloader,
+which is run through its `main`, unchanged, once per combination of
+engine and worker count, each in its own process, into a temporary folder.
+Reports throughput, per-comic latency, requests made and peak memory.
+
+Example:
+    python benchmarks/bench.py --engines threads,asyncio --workers 8,32 --latency 0.05
+"""
+
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from contextlib import redirect_stderr
+from itertools import product
+
+import begin
+
+from path import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import Archive, serve  # noqa: E402
+
+PORT = 8799
+
+
+def percentile(values, fraction):
+    """the value below which `fraction` of sorted `values` lie, None if empty"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def folder_bytes(root):
+    """total size of the comic files under `root`, metadata files excluded"""
+    total = 0
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        total += sum(os.path.getsize(os.path.join(folder, name))
+                     for name in files if not name.startswith('.'))
+    return total
+
+
+def timed(method, durations):
+    """wrap the download `method` of a comic class to log its durations"""
+    if method.__name__.startswith('async'):
+        async def wrapper(self):
+            start = time.perf_counter()
+            try:
+                return await method(self)
+            finally:
+                durations.append(time.perf_counter() - start)
+    else:
+        def wrapper(self):
+            start = time.perf_counter()
+            try:
+                return method(self)
+            finally:
+                durations.append(time.perf_counter() - start)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+def run_once(archive, engine, workers, collections, throttle, verbose, results):
+    """run the downloader once, in this (child) process, put its report in `results`"""
+    import getcomics
+    from comics import registry, scheduler
+
+    # date based collections start with the archive, not decades ago
+    registry.load('sinfest').FIRST = archive.first_day
+    registry.load('commitstrip').FIRST = {'y': archive.first_day.year,
+                                        'm': archive.first_day.month,
+                                        'd': archive.first_day.day}
+    if not throttle:
+        for host in list(scheduler.HOSTS):
+            scheduler.configure(host, 1e6, 1024)
+    durations = []
+    for class_ in map(registry.load, collections.split(',')):
+        class_.download = timed(class_.download, durations)
+        class_.async_download = timed(class_.async_download, durations)
+    getcomics.WORKERS = workers
+
+    with tempfile.TemporaryDirectory(prefix='comics-bench-') as root:
+        summary = os.path.join(root, '.summary.json')
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, redirect_stderr(sys.stderr if verbose else devnull):
+            getcomics.main.__wrapped__(root_path=Path(root), only=collections, engine=engine,
+                                       concurrency=workers, summary=summary)
+        elapsed = time.perf_counter() - start
+        with open(summary) as src:
+            report = json.load(src)
+        size = folder_bytes(root)
+
+    durations.sort()
+    downloaded = report['total']['downloaded']
+    results.put({
+        'engine': engine, 'workers': workers, 'collections': collections,
+        'elapsed': round(elapsed, 3),
+        'outcomes': report['total'],
+        'comics_per_s': round(downloaded / elapsed, 2),
+        'mb_per_s': round(size / 2 ** 20 / elapsed, 2),
+        'p50_ms': round(percentile(durations, .50) * 1000, 1) if durations else None,
+        'p99_ms': round(percentile(durations, .99) * 1000, 1) if durations else None,
+        'client_requests': report['http']['requests'],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+def measure(archive, engine, workers, collections, throttle, verbose, counter):
+    """a single benchmark run in a fresh process, with the server side request count"""
+    results = multiprocessing.Queue()
+    before = counter.value
+    child = multiprocessing.Process(target=run_once, args=(archive, engine, workers, collections,
+                                                           throttle, verbose, results))
+    child.start()
+    child.join()
+    if child.exitcode != 0:
+        raise RuntimeError('benchmark run failed: {} engine, {} workers'.format(engine, workers))
+    result = results.get()
+    result['server_requests'] = counter.value - before
+    return result
+
+
+def show(result):
+    """print `result` as a table row"""
+    print('{engine:>8} {workers:>7} {elapsed:>9} {comics_per_s:>9} {mb_per_s:>7} '
+          '{p50_ms!s:>8} {p99_ms!s:>8} {server_requests:>8} {peak_rss_mb:>8}'.format(**result))
+
+
+@begin.start(auto_convert=True)
+def main(engines: 'engines to compare, separated with commas'='threads',
+         workers: 'worker counts (or asyncio concurrencies) to compare, separated with commas'='32',
+         collections: 'collections to download, separated with commas'='xkcd,sinfest,commitstrip,smbc',
+         xkcd: 'number of xkcd comics served'=500,
+         smbc: 'number of SMBC comics served'=500,
+         days: 'days of Sinfest and CommitStrip served, up to today'=365,
+         image_size: 'bytes per picture'=50000,
+         latency: 'seconds the server waits before each answer'=0.0,
+         error_rate: 'fraction of requests answered with a 503'=0.0,
+         throttle: 'keep the per-host rate limits of the real sites'=False,
+         port: 'port of the mock server'=PORT,
+         verbose: 'show the progress bars of the downloader'=False,
+         output: 'also write the results as JSON to this file'=''):
+    """
+    Benchmark the downloader against a local mock of the comics websites.
+    """
+    archive = Archive(xkcd=xkcd, smbc=smbc, days=days, image_size=image_size)
+    counter = multiprocessing.Value('l', 0)
+    server = multiprocessing.Process(target=serve, args=(port, archive, latency, error_rate, counter),
+                                     daemon=True)
+    server.start()
+    time.sleep(0.2)  # let it bind
+    proxy = 'http://127.0.0.1:{}'.format(port)
+    os.environ['HTTP_PROXY'] = os.environ['http_proxy'] = proxy
+    os.environ.pop('NO_PROXY', None)
+    os.environ.pop('no_proxy', None)
+
+    print('{:>8} {:>7} {:>9} {:>9} {:>7} {:>8} {:>8} {:>8} {:>8}'.format(
+        'engine', 'workers', 'elapsed', 'comics/s', 'MB/s', 'p50 ms', 'p99 ms', 'requests', 'RSS MB'))
+    results = []
+    try:
+        for engine, count in product(engines.split(','), workers.split(',')):
+            result = measure(archive, engine, int(count), collections, throttle, verbose, counter)
+            results.append(result)
+            show(result)
+    finally:
+        server.terminate()
+
+    if output:
+        with open(output, 'w') as dest:
+            json.dump({'archive': {'xkcd': xkcd, 'smbc': smbc, 'days': days,
+                                   'image_size': image_size, 'latency': latency,
+                                   'error_rate': error_rate, 'throttle': throttle},
+                       'results': results}, dest, indent=2)
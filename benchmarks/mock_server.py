@@ -0,0 +1,228 @@
+"""
+A local HTTP server imitating the comics websites, for benchmarks
+
+It is meant to be used as the HTTP proxy of the downloader (HTTP_PROXY),
+so the real code runs unchanged: requests are dispatched on their host.
+Serves xkcd JSON and images, Sinfest GIFs, SMBC pages and CommitStrip
+archives, date and comic pages, with configurable latency and error rate.
+"""
+
+import json
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+
+
+
+def png_chunk(kind, data):
+    """a PNG chunk, with its length and CRC"""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png(size):
+    """a 1x1 grey PNG of `size` bytes, padded with a private ancillary chunk"""
+    head = b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0))
+    head += png_chunk(b'IDAT', zlib.compress(b'\0\0'))
+    tail = png_chunk(b'IEND', b'')
+    padding = max(0, size - len(head) - len(tail) - 12)
+    return head + png_chunk(b'pdNg', b'\0' * padding) + tail
+
+
+def gif(size):
+    """a 1x1 GIF of `size` bytes, padded with a comment extension"""
+    head = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff'
+            b'\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x44\x01\x00')
+    blocks = b''
+    left = size - len(head) - 4  # introducer, label and terminator of the comment, trailer
+    while left >= 2:  # sub-blocks: their size, then up to 255 bytes
+        block = min(255, left - 1)
+        if left - 1 - block == 1:
+            block -= 1  # room for a last sub-block
+        blocks += bytes([block]) + b' ' * block
+        left -= block + 1
+    return head + (b'\x21\xfe' + blocks + b'\x00' if blocks else b'') + b';'
+
+
+# a 1x1 grey baseline JPEG: SOI, APP0 (JFIF), then the tables, frame and scan
+JPEG_HEAD = bytes.fromhex('ffd8ffe000104a46494600010100000100010000')
+JPEG_TAIL = bytes.fromhex(
+    'ffdb004300100b0c0e0c0a100e0d0e1211101318281a181616183123251d283a333d3c39333837'
+    '40485c4e404457453738506d51575f626768673e4d71797064785c656763ffc0000b08000100'
+    '0101011100ffc40014000100000000000000000000000000000007ffc400141001000000000000'
+    '00000000000000000000ffda0008010100003f003f7fffd9')
+
+
+def jpeg(size):
+    """a 1x1 JPEG of `size` bytes, padded with comment segments after its JFIF header"""
+    padding = b''
+    left = size - len(JPEG_HEAD) - len(JPEG_TAIL)
+    while left >= 4:  # marker and length of each comment
+        block = min(65533, left - 4)
+        if 0 < left - 4 - block < 4:
+            block -= 4  # room for a last comment
+        padding += b'\xff\xfe' + struct.pack('>H', block + 2) + b' ' * block
+        left -= block + 4
+    return JPEG_HEAD + padding + JPEG_TAIL
+
+
+FORMATS = {'png': png, 'gif': gif, 'jpeg': jpeg}
+
+
+class Archive:
+    """The content served: sizes of the collections and of their pictures"""
+
+    def __init__(self, xkcd=500, smbc=500, days=365, image_size=50000):
+        self.xkcd = xkcd
+        self.smbc = smbc
+        self.days = days
+        self.image_size = image_size
+        self.today = date.today()
+        self.first_day = self.today - timedelta(days=days - 1)
+        self._images = {}
+
+    def image(self, kind):
+        """a valid picture of `kind` (a key of FORMATS), of the configured size"""
+        if kind not in self._images:
+            self._images[kind] = FORMATS[kind](self.image_size)
+        return self._images[kind]
+
+    def strip_day(self, day):
+        """true if there is a CommitStrip on `day` (week days only)"""
+        return self.first_day <= day <= self.today and day.weekday() < 5
+
+    def route(self, host, path):
+        """(status, content type, body) for a request of `path` on `host`"""
+        domain = host.split('.')[-2] if '.' in host else host
+        handler = getattr(self, 'site_' + domain.replace('-', '_'), None)
+        if handler is None:
+            return 404, 'text/plain', b''
+        return handler(host, path) or (404, 'text/plain', b'')
+
+    def site_xkcd(self, host, path):
+        if host == 'imgs.xkcd.com':
+            return 200, 'image/png', self.image('png')
+        match = re.match(r'/(?:(\d+)/)?info\.0\.json$', path)
+        if not match:
+            return None
+        number = int(match.group(1) or self.xkcd)
+        if not 1 <= number <= self.xkcd:
+            return None
+        info = {'num': number, 'safe_title': 'Comic {}'.format(number),
+                'alt': 'Alt text of comic {}'.format(number),
+                'img': 'http://imgs.xkcd.com/comics/comic_{}.png'.format(number)}
+        return 200, 'application/json', json.dumps(info).encode()
+
+    def site_sinfest(self, host, path):
+        match = re.match(r'/btphp/comics/(\d{4})-(\d\d)-(\d\d)\.gif$', path)
+        if not match or not self.first_day <= date(*map(int, match.groups())) <= self.today:
+            return None
+        return 200, 'image/gif', self.image('gif')
+
+    def site_smbc_comics(self, host, path):
+        if path.startswith('/comics/'):
+            return 200, 'image/png', self.image('png')
+        match = re.match(r'/index\.php\?id=(\d+)$', path)
+        if not match or not 1 <= int(match.group(1)) <= self.smbc:
+            return None
+        number = int(match.group(1))
+        page = ('<html><body><a href="index.php?id={last}" class="last">last</a>'
+                '<img title="Comic of day {n}" src="comics/{n}.png" id="comic" />'
+                '<div id="aftercomic">{after}</div></body></html>')
+        after = "<img src='http://smbc-comics.com/comics/{}after.png'>".format(number)
+        return 200, 'text/html', page.format(last=self.smbc, n=number,
+                                             after=after if number % 3 == 0 else '').encode()
+
+    def site_commitstrip(self, host, path):
+        if path.startswith('/wp-content/uploads/'):
+            return 200, 'image/jpeg', self.image('jpeg')
+        match = re.match(r'/(\w\w)/(\d{4})/(\d\d)/(?:(\d\d)/(?:([\w-]+)/)?)?(?:page/(\d+)/)?$', path)
+        if not match:
+            return None
+        lang, year, month, day, slug, page = match.groups()
+        year, month = int(year), int(month)
+        base = 'http://www.commitstrip.com/{}/{:04}/{:02}/'.format(lang, year, month)
+        if day is None:  # monthly archive, everything on the first page
+            if page is not None:
+                return None
+            days = [d for d in range(1, 32) if self._strip_on(year, month, d)]
+            if not days:
+                return None
+            links = ''.join('<a href="{}{:02}/strip-{}/">strip</a>'.format(base, d, d)
+                            for d in days)
+            return 200, 'text/html', ('<html>' + links + '</html>').encode()
+        if not self._strip_on(year, month, int(day)):
+            return None
+        url = '{}{}/'.format(base, day)
+        if slug is None:  # date page
+            return 200, 'text/html', '<a href="{}strip-{}/">strip</a>'.format(url, int(day)).encode()
+        uploads = 'http://www.commitstrip.com/wp-content/uploads/{:04}/{:02}/'.format(year, month)
+        page = ('<html><head><title>Strip {d} | CommitStrip</title></head>'
+                '<img src="{u}Strip-{d}-en.jpg"><img src="{u}Strip-{d}-fr.jpg"></html>')
+        return 200, 'text/html', page.format(d=day, u=uploads).encode()
+
+    def _strip_on(self, year, month, day):
+        try:
+            return self.strip_day(date(year, month, day))
+        except ValueError:
+            return False
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering from an `Archive`"""
+
+    daemon_threads = True
+
+    def __init__(self, address, archive, latency=0.0, error_rate=0.0, counter=None):
+        super().__init__(address, MockHandler)
+        self.archive = archive
+        self.latency = latency
+        self.error_rate = error_rate
+        self.counter = counter
+
+    def handle_error(self, request, client_address):
+        """clients closing their connections are no news"""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Handles proxied requests (absolute urls) and direct ones (Host header)"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if server.counter is not None:
+            with server.counter.get_lock():
+                server.counter.value += 1
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlsplit(self.path)
+        host = url.hostname or self.headers.get('Host', '').split(':')[0]
+        path = url.path + ('?' + url.query if url.query else '')
+        if server.error_rate and random.random() < server.error_rate:
+            status, content_type, body = 503, 'text/plain', b'try again later'
+        else:
+            status, content_type, body = server.archive.route(host, path)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """stay quiet"""
+
+
+def serve(port, archive, latency=0.0, error_rate=0.0, counter=None):
+    """serve `archive` on localhost:`port` until killed"""
+    MockServer(('127.0.0.1', port), archive, latency=latency,
+               error_rate=error_rate, counter=counter).serve_forever()
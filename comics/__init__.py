@@ -1,13 +1,34 @@
 """
 Proposes tools to get infos, or download several webcomics
 Not endorsed by the authors of the comics in any way.
+
+The classes are imported on first access (see `registry`), so importing the
+package, or a single collection, stays cheap.
 """
 
-from .webcomic import WebComic
-from .xkcd import XKCDComic
-from .sinfest import SinfestComic
-from .commitstrip import CommitStripComic
-from .smbc import SMBCComic
+import sys
+
+from . import registry
 
 __all__ = ['WebComic', 'XKCDComic', 'SinfestComic', 'CommitStripComic', 'SMBCComic']
 __author__ = "Atrament"
+
+_CLASSES = {target.partition(':')[2]: name for name, target in registry.BUILTIN.items()}
+
+
+def __getattr__(attr):
+    """import the collection classes when first accessed (python 3.7+)"""
+    if attr == 'WebComic':
+        from .webcomic import WebComic
+        return WebComic
+    if attr in _CLASSES:
+        return registry.load(_CLASSES[attr])
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, attr))
+
+
+if sys.version_info < (3, 7):  # no module __getattr__, import them all now
+    from .webcomic import WebComic
+    from .xkcd import XKCDComic
+    from .sinfest import SinfestComic
+    from .commitstrip import CommitStripComic
+    from .smbc import SMBCComic
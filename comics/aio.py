@@ -0,0 +1,216 @@
+"""
+Defines an asyncio download engine, the counterpart of the `net` session
+
+Requires aiohttp (see requirements-asyncio.txt), which is only imported
+when this engine is used. Requests and connections are counted along with
+those of the `net` session.
+"""
+
+import asyncio
+import time
+
+from urllib.parse import urlsplit
+
+from . import metrics, net, parsing, retry
+from .scheduler import throttle_for
+from .utils import PartialDownload
+
+CONCURRENCY = 256  # comics processed at once
+
+_session = None
+
+
+async def get(url, headers=None):
+    """
+    GET `url` with the running engine's session, within the host's limits, return a `Page`.
+    Transient failures are retried after a backoff, see `retry`.
+    """
+    attempt = 0
+    while True:
+        throttle = await _acquire(url)
+        net._count('requests')
+        status = None
+        try:
+            async with _session.get(url, headers=headers) as resp:
+                status = resp.status
+                metrics.count_response(url, status)
+                if retry.transient(status) and attempt < retry.RETRIES:
+                    wait = retry.delay(attempt + 1, resp.headers)
+                else:
+                    content = await resp.read()
+                    text = await resp.text(errors='replace')
+                    metrics.count_bytes(url, len(content))
+                    return net.Page(resp.status, content, text, resp.headers)
+        except _transient_errors():
+            if attempt >= retry.RETRIES:
+                raise
+            wait = retry.delay(attempt + 1)
+        finally:
+            throttle.release(status)
+        attempt += 1
+        metrics.count_retry(url)
+        await asyncio.sleep(wait)
+
+
+async def get_page(url):
+    """asynchronous version of `net.get_page`"""
+    cache = net.http_cache()
+    if cache is None:
+        return await get(url)
+    entry = cache.lookup(url)
+    if entry is not None and cache.fresh(entry):
+        return net.cached_page(entry)
+    page = await get(url, headers=cache.request_headers(entry))
+    if page.status_code == 304 and entry is not None:
+        cache.refresh(url, entry)
+        return net.cached_page(entry)
+    if page.status_code == 200:
+        cache.store(url, page.content, page.headers)
+    return page
+
+
+async def download_to(url, target):
+    """asynchronous version of `net.download_to`"""
+    partial = PartialDownload(target, url)
+    headers = partial.request_headers()
+    start = time.perf_counter()
+    received = writing = attempt = 0
+    try:
+        while True:
+            throttle = await _acquire(url)
+            net._count('requests')
+            status = None
+            try:
+                async with _session.get(url, headers=headers) as resp:
+                    status = resp.status
+                    metrics.count_response(url, status)
+                    if headers and (status == 416 or status == 206 and not partial.resumes(resp.headers)):
+                        partial.discard()  # the range is not usable, fetch everything
+                        headers = {}
+                        metrics.count_retry(url)
+                        continue
+                    if retry.transient(status) and attempt < retry.RETRIES:
+                        wait = retry.delay(attempt + 1, resp.headers)
+                    elif status not in (200, 206):
+                        return status
+                    else:
+                        with partial.receiving(status, resp.headers) as part:
+                            async for chunk in resp.content.iter_chunked(net.CHUNK_SIZE):
+                                received += len(chunk)
+                                before = time.perf_counter()
+                                part.write(chunk)
+                                writing += time.perf_counter() - before
+                        return 200
+            except _transient_errors():
+                if attempt >= retry.RETRIES:
+                    raise
+                wait = retry.delay(attempt + 1)
+                headers = partial.request_headers()  # resume from what was received
+            finally:
+                throttle.release(status)
+            attempt += 1
+            metrics.count_retry(url)
+            await asyncio.sleep(wait)
+    finally:
+        metrics.count_bytes(url, received)
+        metrics.add_time(url, 'write', writing)
+        metrics.add_time(url, 'transfer', time.perf_counter() - start - writing)
+
+
+def _transient_errors():
+    """the aiohttp failures of a request or of a transfer worth trying again"""
+    import aiohttp
+    return aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError
+
+
+async def _acquire(url):
+    """wait for the throttle of `url`'s host to allow a request, and return it"""
+    throttle = throttle_for(urlsplit(url).hostname)
+    wait = throttle.try_acquire()
+    while wait:
+        await asyncio.sleep(wait)
+        wait = throttle.try_acquire()
+    return throttle
+
+
+async def drive(steps):
+    """asynchronous version of `net.drive`"""
+    loop = asyncio.get_event_loop()
+    url = ''
+    try:
+        step = next(steps)
+        while True:
+            start = time.perf_counter()
+            if isinstance(step, parsing.Job):
+                result = await parsing.async_run(step, loop)
+                metrics.add_time(url, 'parse', time.perf_counter() - start)
+            else:
+                url = step
+                result = await get_page(url)
+                metrics.add_time(url, 'metadata', time.perf_counter() - start)
+            step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _connection_made(session, context, params):
+    """trace callback of the connector, see `net.stats`"""
+    net._count('connections')
+
+
+def _finish(task, limit):
+    """release the slot of a finished task, its failure is left to `done` callbacks"""
+    limit.release()
+    if not task.cancelled():
+        task.exception()  # mark as retrieved, like failed futures of the thread engine
+
+
+async def download_all(comics, concurrency=CONCURRENCY, done=None):
+    """
+    Download all `comics`, with at most `concurrency` of them in flight.
+    `done` is called with each comic and its finished task.
+    """
+    global _session
+    import aiohttp  # optional dependency, only needed by this engine
+    limit = asyncio.BoundedSemaphore(concurrency)
+    pending = set()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=net.TIMEOUT)
+    tracing = aiohttp.TraceConfig()
+    tracing.on_connection_create_end.append(_connection_made)
+    # trust_env: honour HTTP(S)_PROXY like requests does
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trust_env=True,
+                                     trace_configs=[tracing],
+                                     headers={'User-Agent': net.USER_AGENT}) as session:
+        _session = session
+        loop = asyncio.get_event_loop()
+        comics = iter(comics)
+        while True:
+            await limit.acquire()
+            # enumerating may block on the network (throttling, backoff): off the loop
+            comic = await loop.run_in_executor(None, next, comics, None)
+            if comic is None:
+                limit.release()
+                break
+            task = asyncio.ensure_future(comic.async_download())
+            task.add_done_callback(lambda done_task: _finish(done_task, limit))
+            task.add_done_callback(pending.discard)
+            if done is not None:
+                task.add_done_callback(lambda done_task, comic=comic: done(comic, done_task))
+            pending.add(task)
+        if pending:
+            await asyncio.wait(pending)
+    _session = None
+
+
+def run(comics, concurrency=CONCURRENCY, done=None):
+    """run the asyncio engine on `comics` until they are all processed"""
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        raise RuntimeError('the asyncio engine requires aiohttp')
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(download_all(comics, concurrency=concurrency, done=done))
+    finally:
+        loop.close()
@@ -0,0 +1,107 @@
+"""
+Defines a content-addressed store of pictures, shared by all the collections
+"""
+
+import hashlib
+import os
+
+from path import Path
+
+from .utils import RecordFile
+from .verify import check
+
+
+class URLDigests(RecordFile):
+    """The digest of the picture fetched from each url, see `BlobStore`"""
+
+    FILENAME = 'urls.jsonl'
+    KEY = 'url'
+
+    def digest(self, url):
+        """the digest of the picture of `url`, or None"""
+        record = self.records.get(url)
+        return record['digest'] if record is not None else None
+
+
+class BlobStore:
+    """
+    Pictures stored once under the SHA-256 of their content, and hardlinked
+    to their names in the collection folders
+
+    The url each picture came from is remembered, so a url met again (in
+    another collection, language, or after a rename) is linked instead of
+    fetched. Where hardlinks are not possible, files are simply left alone.
+
+    Examples:
+        >>> blobs = BlobStore('~/Images/comics')
+        >>> blobs.link('http://imgs.xkcd.com/comics/python.png', '/tmp/0353-python.png')
+        True
+    """
+
+    FOLDER = '.blobs'
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, root):
+        """Open (and load) the store under the `root` folder of the collections"""
+        self.folder = Path(root).expand().abspath().joinpath(self.FOLDER)
+        if not self.folder.isdir():
+            self.folder.makedirs()
+        self.urls = URLDigests(self.folder)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def blob(self, digest):
+        """where the picture of `digest` is stored"""
+        return self.folder.joinpath(digest[:2], digest[2:])
+
+    def digest(self, path):
+        """the hex SHA-256 of the file at `path`"""
+        sha = hashlib.sha256()
+        with open(path, 'rb') as src:
+            for block in iter(lambda: src.read(self.BLOCK_SIZE), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def link(self, url, target):
+        """make `target` a link to the picture already fetched from `url`, true on success"""
+        digest = self.urls.digest(url)
+        if digest is None or check(self.blob(digest)) is not None:
+            return False  # unknown, gone or corrupt
+        try:
+            replace_with_link(self.blob(digest), target)
+        except OSError:
+            return False
+        return True
+
+    def adopt(self, target, url=None):
+        """
+        store the picture just written at `target`, fetched from `url`.
+        `target` becomes a link to the stored copy, which may already exist.
+        Return the digest of the picture.
+        """
+        digest = self.digest(target)
+        blob = self.blob(digest)
+        try:
+            if not blob.parent.isdir():
+                blob.parent.makedirs_p()
+            try:
+                os.link(target, blob)
+            except FileExistsError:
+                if not os.path.samefile(target, blob):
+                    replace_with_link(blob, target)
+        except OSError:
+            return digest  # no hardlinks here, keep the plain file
+        if url is not None and self.urls.digest(url) != digest:
+            self.urls.put({'url': url, 'digest': digest})
+        return digest
+
+
+def replace_with_link(source, target):
+    """atomically make `target` a hardlink to `source`"""
+    folder, name = os.path.split(target)
+    tmp = os.path.join(folder, '.' + name + '.link')
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.link(source, tmp)
+    os.replace(tmp, target)
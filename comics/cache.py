@@ -0,0 +1,107 @@
+"""
+Defines an on-disk HTTP cache for metadata and listing pages
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+from path import Path
+
+from .utils import atomic_write
+
+
+class HTTPCache:
+    """
+    Stores page bodies along with their validators (ETag / Last-Modified),
+    so they can be revalidated with conditional requests, and what was parsed
+    from them, so unchanged pages are not parsed again (see `net.get_parsed`).
+    Entries younger than `ttl` seconds are trusted without asking the server.
+
+    Examples:
+        >>> net.set_cache(HTTPCache('~/Images/comics/.cache/http', ttl=3600))
+        >>> net.get_page('http://xkcd.com/info.0.json')  # at most one request per hour
+    """
+
+    def __init__(self, folder, ttl=0):
+        self.folder = Path(folder).expand().abspath()
+        if not self.folder.isdir():
+            self.folder.makedirs()
+        self.ttl = ttl
+
+    def _paths(self, url):
+        """the metadata and body files for `url`"""
+        key = hashlib.sha1(url.encode()).hexdigest()
+        base = self.folder.joinpath(key[:2], key)
+        return base + '.json', base + '.body'
+
+    def lookup(self, url):
+        """the cache entry of `url`, or None"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as src:
+                entry = json.load(src)
+            with open(body_path, 'rb') as src:
+                entry['content'] = src.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def fresh(self, entry):
+        """true if `entry` may be used without contacting the server"""
+        return bool(self.ttl) and time.time() - entry['stored'] < self.ttl
+
+    @staticmethod
+    def request_headers(entry):
+        """the headers of a conditional request revalidating `entry`"""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, content, headers):
+        """store the body and validators of a 200 response to `url`, return the entry"""
+        meta_path, body_path = self._paths(url)
+        folder = os.path.dirname(meta_path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        with atomic_write(body_path) as dest:
+            dest.write(content)
+        entry = {'url': url, 'stored': time.time(),
+                 'etag': headers.get('ETag'),
+                 'last_modified': headers.get('Last-Modified'),
+                 'content_type': headers.get('Content-Type', '')}
+        with atomic_write(meta_path, 'w') as dest:
+            json.dump(entry, dest)
+        return entry
+
+    def refresh(self, url, entry):
+        """mark `entry` as just revalidated by the server"""
+        meta_path, _ = self._paths(url)
+        entry = {key: value for key, value in entry.items() if key != 'content'}
+        entry['stored'] = time.time()
+        with atomic_write(meta_path, 'w') as dest:
+            json.dump(entry, dest)
+
+    def keep_parsed(self, url, entry, value):
+        """store `value`, parsed from the body of `entry`, beside its validators"""
+        meta_path, _ = self._paths(url)
+        entry = {key: item for key, item in entry.items() if key != 'content'}
+        entry['parsed'] = value
+        with atomic_write(meta_path, 'w') as dest:
+            json.dump(entry, dest)
+
+    @staticmethod
+    def text(entry):
+        """the decoded body of `entry`"""
+        match = re.search(r'charset=([\w-]+)', entry.get('content_type') or '')
+        try:
+            return entry['content'].decode(match.group(1) if match else 'utf-8', 'replace')
+        except LookupError:  # unknown charset
+            return entry['content'].decode('utf-8', 'replace')
@@ -13,30 +13,54 @@
 # m = regex.search(r.text)
 # m.groups()[0]  # gives the Comics title
 
+import os
 import re
-import html
 
 from datetime import date, timedelta
 
-import requests
-
+from . import net
+from .parsing import Job, parse_commitstrip_comicpage, parse_commitstrip_datepage
+from .retry import HTTPStatusError
 from .webcomic import WebComic
 
 
 class CommitStripComic(WebComic):
     """Class for Commit strip webcomics"""
 
+    __slots__ = ('page',)
     destination_folder = None
+    HOST = 'www.commitstrip.com'
     FIRST = {'y': 2012, 'm': 2, 'd': 22}
     DATEPAGE_TEMPLATE = 'http://www.commitstrip.com/{l}/{y:>04}/{m:>02}/{d:>02}/'
     COMICPAGE_TEMPLATE = 'http://www.commitstrip.com/wp-content/uploads/{y:>04}/{m:>02}/'
-    TITLE_REGEX = re.compile(r'<title>(.*) \|.*</title>')
+    ARCHIVE_TEMPLATE = 'http://www.commitstrip.com/{l}/{y:>04}/{m:>02}/'
+    POST_REGEX = r'https?://www\.commitstrip\.com/{l}/{y:>04}/{m:>02}/(\d\d)/[^ "\'/#?]+/'
     LANG = 'en'
+    LANGS = ('en', 'fr')  # languages of the pictures found on every comic page
+    ALL_LANGS = False  # also get the other languages, into a subfolder each
+    ENUMERATIONS = ('archive', 'daily')
+    ENUMERATION = 'archive'
+    DATED = True
 
-    def __init__(self, number):
-        """Make a CommitStrip WebComic object"""
+    def __init__(self, number, page=None):
+        """Make a CommitStrip WebComic object, `page` is the url of its comic page if known"""
         super().__init__(number)
-        self.data = ''
+        self.page = page
+
+    @property
+    def uid(self):
+        """the publication day of this comic"""
+        return self.date_of(self.number).isoformat()
+
+    @classmethod
+    def date_of(cls, number):
+        """the publication day of comic `number`"""
+        return date(cls.FIRST['y'], cls.FIRST['m'], cls.FIRST['d']) + timedelta(days=number - 1)
+
+    @classmethod
+    def number_of(cls, day):
+        """the number of the comic published on `day`"""
+        return (day - date(cls.FIRST['y'], cls.FIRST['m'], cls.FIRST['d'])).days + 1
 
     @staticmethod
     def latest_id():
@@ -50,47 +74,175 @@ class CommitStripComic(WebComic):
         return cls.FIRST['y'], cls.FIRST['m'], cls.FIRST['d'],
 
     @classmethod
-    def all(cls):
-        """ return an iterable of all the currently
-        available comics form this collection
+    def iter_ids(cls, start=1):
+        """ return an iterable of the numbers of all the calendar
+        days since the first comic, from number `start` """
+        return range(max(start, 1), cls.number_of(date.today()) + 1)
+
+    @classmethod
+    def listing(cls, folder):
+        """the names of the files of `folder`, and of its language subfolders if `ALL_LANGS`"""
+        names = super().listing(folder)
+        for lang in cls.LANGS if cls.ALL_LANGS else ():
+            subfolder = os.path.join(folder, lang)
+            if os.path.isdir(subfolder):
+                names.update(os.path.join(lang, name) for name in os.listdir(subfolder))
+        return names
+
+    @classmethod
+    def complete(cls, number, names):
         """
-        out = []
-        num = 1
-        day = date(cls.FIRST['y'], cls.FIRST['m'], cls.FIRST['d'])
+        see `WebComic.complete`, false if the index has no metadata to tell:
+        the numbers are shared by the languages, only the comic page tells
+        which pictures (and, with `ALL_LANGS`, which other languages) it has
+        """
+        record = cls.index.get(number) if cls.index is not None else None
+        if record is None or not record.get('data'):
+            return False
+        return super().complete(number, names)
+
+    @staticmethod
+    def picture_name(number, url):
+        """the filename of the picture of comic `number` at `url`"""
+        return '{:>04}-{}'.format(number, url.split('/')[-1])
+
+    @classmethod
+    def iter_comics(cls, start=1, newest_first=False):
+        """ lazily yield the currently available comics
+        form this collection, from number `start` (or down to it),
+        enumerated with the `ENUMERATION` strategy
+        """
+        if cls.ENUMERATION not in cls.ENUMERATIONS:
+            raise ValueError('unknown enumeration: {}'.format(cls.ENUMERATION))
+        return getattr(cls, cls.ENUMERATION + '_comics')(start, newest_first=newest_first)
+
+    @classmethod
+    def daily_comics(cls, start=1, stop=None, newest_first=False):
+        """one comic per calendar day, from number `start` up to `stop` (today by default)"""
+        if stop is None:
+            stop = cls.number_of(date.today())
+        numbers = range(max(start, 1), stop + 1)
+        for num in reversed(numbers) if newest_first else numbers:
+            yield cls(num)
+
+    @classmethod
+    def archive_comics(cls, start=1, newest_first=False):
+        """
+        the comics listed by the monthly archive pages, from number `start` (or down to it).
+        Months whose archive cannot be read are enumerated day by day.
+        """
+        first = cls.date_of(max(start, 1))
         today = date.today()
-        while day <= today:
-            out.append(CommitStripComic(num))
-            day += timedelta(days=1)
-            num += 1
-        return out
+        months = [(year, month) for year in range(first.year, today.year + 1) for month in range(1, 13)
+                  if (first.year, first.month) <= (year, month) <= (today.year, today.month)]
+        for year, month in reversed(months) if newest_first else months:
+            pages = cls.archive_pages(year, month)
+            if pages is None:
+                month_start = max(cls.number_of(date(year, month, 1)), start)
+                next_month = date(year + month // 12, month % 12 + 1, 1)
+                month_stop = min(cls.number_of(next_month) - 1, cls.number_of(today))
+                yield from cls.daily_comics(month_start, month_stop, newest_first=newest_first)
+            else:
+                for day in sorted(pages, reverse=newest_first):
+                    number = cls.number_of(date(year, month, day))
+                    if number >= start:
+                        yield cls(number, page=pages[day])
 
-    def ensure_data(self):
-        """download the data when and if necessary"""
-        if self.data is not '':
-            return self.data
-        self.data = None
-        this_date = date(self.FIRST['y'], self.FIRST['m'], self.FIRST['d'])
-        this_date += timedelta(days=self.number - 1)
-        url = self.DATEPAGE_TEMPLATE.format(l=self.LANG,
-                                            y=this_date.year,
-                                            m=this_date.month,
-                                            d=this_date.day)
-        firstpage = requests.get(url, timeout=10)
-        if firstpage.status_code == 404:
+    @classmethod
+    def archive_pages(cls, year, month):
+        """
+        the comic pages of a month, as {day: url}, read from its (paginated) archive.
+        None if the archive could not be read.
+        """
+        url = cls.ARCHIVE_TEMPLATE.format(l=cls.LANG, y=year, m=month)
+        post_regex = re.compile(cls.POST_REGEX.format(l=cls.LANG, y=year, m=month))
+        pages = {}
+        page_number = 1
+        while True:
+            page_url = url if page_number == 1 else url + 'page/{}/'.format(page_number)
+            try:
+                # the posts of the page as [day, url] pairs, kept by the HTTP cache
+                listing, posts = net.get_parsed(
+                    page_url, lambda listing: [[int(match.group(1)), match.group(0)]
+                                               for match in post_regex.finditer(listing.text)])
+            except OSError:
+                return None
+            if listing.status_code == 404:
+                return pages  # no (more) strips this month
+            if listing.status_code != 200:
+                return None
+            found = 0
+            for day, post_url in posts:
+                if day not in pages:  # first post of the day, as the day by day crawl
+                    pages[day] = post_url
+                    found += 1
+            if not found:
+                return pages
+            page_number += 1
+
+    def fetch_data(self):
+        """Generator of the requests needed to get the data, see `net.drive`"""
+        this_date = self.date_of(self.number)
+        new_url = self.page
+        if new_url is None:
+            url = self.DATEPAGE_TEMPLATE.format(l=self.LANG,
+                                                y=this_date.year,
+                                                m=this_date.month,
+                                                d=this_date.day)
+            firstpage = yield url
+            if firstpage.status_code in self.MISSING:
+                self.record_gap(firstpage.status_code)
+                return
+            if firstpage.status_code != 200:
+                raise HTTPStatusError(url, firstpage.status_code)
+            # crawl the second step: find the link to the comicpage
+            new_url = yield Job(parse_commitstrip_datepage, (firstpage.text, url))
+        comicpage = yield new_url
+        if comicpage.status_code in self.MISSING:
+            self.record_gap(comicpage.status_code)
             return
-        # crawl the second step: find the regex to the comicpage
-        new_url = re.compile(url + '[^ "]+').findall(firstpage.text)[0]
-        comicpage = requests.get(new_url)
         if comicpage.status_code != 200:
-            return
-        coregex = re.compile(self.COMICPAGE_TEMPLATE.format(y=this_date.year, m=this_date.month) +
-                             '[^ "]+')
-        links = coregex.findall(comicpage.text)
+            raise HTTPStatusError(new_url, comicpage.status_code)
         # almost there...
-        matchintitle = self.TITLE_REGEX.search(comicpage.text)
-        title = html.unescape(matchintitle.groups()[0]).replace(' | CommitStrip', '')
-        self.data = {'img-en': links[0], 'title': title, 'img-fr': links[1]}
-        return self.data  # return a non-empty object to signal success
+        uploads_url = self.COMICPAGE_TEMPLATE.format(y=this_date.year, m=this_date.month)
+        data = yield Job(parse_commitstrip_comicpage, (comicpage.text, uploads_url))
+        return data
+
+    def other_languages(self):
+        """(language, url) of the pictures of this comic in the other languages"""
+        if not self.ensure_data():
+            return []
+        return [(lang, self.data['img-{}'.format(lang)]) for lang in self.LANGS
+                if lang != self.LANG and self.data.get('img-{}'.format(lang))]
+
+    def pictures(self):
+        """the filenames of the pictures of this comic, with the other languages if `ALL_LANGS`"""
+        out = [self.filename]
+        if self.ALL_LANGS:
+            out.extend(os.path.join(lang, self.picture_name(self.number, url))
+                       for lang, url in self.other_languages())
+        return out
+
+    def extra_pictures(self):
+        """
+        (url, target) of the pictures of this comic in the other languages,
+        still to fetch when `ALL_LANGS` is set. They come from the same comic page.
+        """
+        if not self.ALL_LANGS or self.destination_folder is None:
+            return []
+        out = []
+        for lang, url in self.other_languages():
+            folder = self.destination_folder.joinpath(lang)
+            target = folder.joinpath(self.picture_name(self.number, url))
+            if not target.isfile():
+                folder.makedirs_p()
+                out.append((url, target))
+        return out
+
+    async def async_extra_pictures(self):
+        if self.ALL_LANGS:
+            await self.async_ensure_data()
+        return self.extra_pictures()
 
     def __str__(self):
         if self.ensure_data():
@@ -130,5 +282,4 @@ class CommitStripComic(WebComic):
         """The candidate filename for this comics image"""
         if not self.ensure_data():
             return
-        imgname = self.image_url.split('/')[-1]
-        return '{:>04}-{}'.format(self.number, imgname)
+        return self.picture_name(self.number, self.image_url)
@@ -0,0 +1,37 @@
+"""
+Defines a persistent queue of the comics whose download failed
+"""
+
+from datetime import date
+
+from .utils import RecordFile
+
+
+class FailureQueue(RecordFile):
+    """
+    Comics of a collection that could not be downloaded, with the reason why
+
+    Stored as JSON lines appended to a file in the destination folder, see
+    `utils.RecordFile`. Comics stay queued until a later run gets them (or
+    finds them missing), so they can be retried without enumerating the
+    whole collection again.
+
+    Examples:
+        >>> failures = FailureQueue('~/Images/comics/smbc')
+        >>> failures.records[1234]['reason']
+        'HTTPStatusError: http://smbc-comics.com/index.php?id=1234 answered 503'
+    """
+
+    FILENAME = '.failures.jsonl'
+    VALUE = 'reason'
+
+    def add(self, number, reason):
+        """queue comic `number`, which failed because of `reason`"""
+        previous = self.records.get(number, {})
+        self.put({'number': number, 'reason': reason, 'seen': date.today().isoformat(),
+                  'attempts': previous.get('attempts', 0) + 1})
+
+    def numbers(self):
+        """the queued comic numbers, in order"""
+        with self._lock:
+            return sorted(self.records)
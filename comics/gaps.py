@@ -0,0 +1,46 @@
+"""
+Defines a persistent record of the days without comic in a date-based collection
+"""
+
+from datetime import date
+
+from .utils import RecordFile
+
+
+class GapCache(RecordFile):
+    """
+    Known missing comics of a collection, with the status seen when probing them
+
+    Stored as JSON lines appended to a file in the destination folder, see
+    `utils.RecordFile`. A gap is probed again while the missing comic is
+    less than `recheck_days` old (strips are sometimes published late),
+    then it is confirmed and never probed again.
+
+    Examples:
+        >>> gaps = GapCache('~/Images/comics/sinfest', recheck_days=30)
+        >>> gaps.confirmed(42)
+        True
+    """
+
+    FILENAME = '.gaps.jsonl'
+    VALUE = 'status'
+    RECHECK_DAYS = 30
+
+    def __init__(self, folder, recheck_days=RECHECK_DAYS):
+        """Open (and load) the gaps of `folder`"""
+        self.recheck_days = recheck_days
+        super().__init__(folder)
+
+    def add(self, number, day, status):
+        """record that comic `number`, of `day`, was missing with `status`"""
+        self.put({'number': number, 'day': day.isoformat(), 'status': status,
+                  'seen': date.today().isoformat()})
+
+    def confirmed(self, number, today=None):
+        """true if `number` is a gap too old to be worth probing again"""
+        record = self.records.get(number)
+        if record is None:
+            return False
+        today = today or date.today()
+        missing_day = date(*[int(n) for n in record['day'].split('-')])
+        return (today - missing_day).days > self.recheck_days
@@ -0,0 +1,68 @@
+"""
+Defines a persistent index of the comics metadata of a collection
+"""
+
+import json
+import os
+
+from .utils import RecordFile
+
+
+class ComicIndex(RecordFile):
+    """
+    On-disk index of the comics already known in a destination folder
+
+    Records are stored as JSON lines, appended after each download,
+    see `utils.RecordFile`.
+
+    Examples:
+        >>> index = ComicIndex('~/Images/comics/xkcd')
+        >>> index.get(353)['filename']
+        '0353-python.png'
+    """
+
+    FILENAME = '.index.jsonl'
+
+    def add(self, record):
+        """register `record` and append it to the file"""
+        self.put(record)
+
+    def extend(self, records):
+        """register many `records` at once, appended to the file in one go"""
+        self.put(*records)
+
+    def rebuild(self):
+        """
+        Rebuild the index from the files present in the folder
+
+        Metadata of known records is kept when their file still exists,
+        other files only give their number and filename.
+        """
+        with self._lock:
+            found = {}
+            for name in sorted(os.listdir(self.folder)):
+                number = number_prefix(name)
+                if number is None or number in found:
+                    continue
+                record = self.records.get(number)
+                if record is None or record.get('filename') != name:
+                    record = {'number': number, 'filename': name}
+                found[number] = record
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as dest:
+                for number in sorted(found):
+                    dest.write(json.dumps(found[number], sort_keys=True) + '\n')
+            os.replace(tmp, self.path)
+            self.records = found
+            self._unterminated = False
+        return len(found)
+
+
+def number_prefix(filename):
+    """the comic number a picture filename starts with (as in '0042-title.png'), or None"""
+    if filename.startswith('.') or filename.endswith('.txt'):
+        return None
+    prefix = filename.split('-', 1)[0]
+    if not prefix.isdigit():
+        return None
+    return int(prefix)
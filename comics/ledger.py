@@ -0,0 +1,210 @@
+"""
+Defines a shared ledger of work, for several downloaders to split collections
+
+The ledger is a SQLite file, on a disk all the workers can reach. Each
+collection is cut into shards: ranges of comic numbers. Workers claim
+shards under a lease they renew while working on them; the shard of a
+worker that stopped renewing (crashed, killed) is claimed again by another
+once its lease expired. Beware that SQLite locking is unreliable on some
+network filesystems (NFS), where a single machine should hold the file.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from collections import namedtuple
+
+Shard = namedtuple('Shard', 'collection start stop')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    collection TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    PRIMARY KEY (collection, start)
+)
+"""
+
+
+def default_owner():
+    """a name for this worker, unique across the machines"""
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+class Ledger:
+    """
+    Shards of the collections, and which worker holds them until when
+
+    Examples:
+        >>> ledger = Ledger('/shared/comics.ledger', lease=300)
+        >>> ledger.plan('xkcd', 1, 2000, size=100)
+        20
+        >>> ledger.claim(['xkcd'])
+        Shard(collection='xkcd', start=0, stop=100)
+    """
+
+    LEASE = 300  # seconds a claim lasts without being renewed
+
+    def __init__(self, path, owner=None, lease=LEASE):
+        """Open (or create) the ledger at `path`, as the worker `owner`"""
+        self.path = path
+        self.owner = owner or default_owner()
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute(SCHEMA)
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _transaction(self, statements):
+        """run `statements(cursor)` in a write transaction, return its result"""
+        with self._lock:
+            cursor = self._db.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                out = statements(cursor)
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return out
+
+    def plan(self, collection, start, stop, size):
+        """
+        cut comics `start` to `stop` (excluded) of `collection` into shards of `size`,
+        aligned on multiples of `size` so that every worker plans the same ones.
+        Shards already planned are kept, a last shard that grew is worked again.
+        Return the number of shards of the collection.
+        """
+        def statements(cursor):
+            for first in range(start - start % size, stop, size):
+                last = min(first + size, stop)
+                cursor.execute('INSERT OR IGNORE INTO shards (collection, start, stop) '
+                               'VALUES (?, ?, ?)', (collection, first, last))
+                cursor.execute("UPDATE shards SET stop = ?, "
+                               "state = CASE WHEN state = 'done' THEN 'pending' ELSE state END "
+                               "WHERE collection = ? AND start = ? AND stop < ?",
+                               (last, collection, first, last))
+            cursor.execute('SELECT COUNT(*) FROM shards WHERE collection = ?', (collection,))
+            return cursor.fetchone()[0]
+        return self._transaction(statements)
+
+    def claim(self, collections, newest_first=False):
+        """
+        lease the next pending (or abandoned) shard of `collections`, None when there is none.
+        Shards are claimed from the first comics, or from the last ones if `newest_first`.
+        """
+        marks = ','.join('?' * len(collections))
+        order = 'DESC' if newest_first else 'ASC'
+
+        def statements(cursor):
+            now = time.time()
+            cursor.execute("SELECT collection, start, stop FROM shards "
+                           "WHERE collection IN ({}) AND (state = 'pending' "
+                           "OR state = 'leased' AND lease_until < ?) "
+                           "ORDER BY state = 'leased', start {}, collection LIMIT 1".format(marks, order),
+                           list(collections) + [now])
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute("UPDATE shards SET state = 'leased', owner = ?, lease_until = ? "
+                           "WHERE collection = ? AND start = ?",
+                           (self.owner, now + self.lease, row[0], row[1]))
+            return Shard(*row)
+        return self._transaction(statements)
+
+    def renew(self):
+        """extend the leases of the shards this worker holds"""
+        self._transaction(lambda cursor: cursor.execute(
+            "UPDATE shards SET lease_until = ? WHERE owner = ? AND state = 'leased'",
+            (time.time() + self.lease, self.owner)))
+
+    def complete(self, shard):
+        """mark `shard` as done"""
+        self._transaction(lambda cursor: cursor.execute(
+            "UPDATE shards SET state = 'done', lease_until = NULL "
+            "WHERE collection = ? AND start = ? AND owner = ?",
+            (shard.collection, shard.start, self.owner)))
+
+    def release(self):
+        """give back the shards this worker holds and did not complete"""
+        self._transaction(lambda cursor: cursor.execute(
+            "UPDATE shards SET state = 'pending', owner = NULL, lease_until = NULL "
+            "WHERE owner = ? AND state = 'leased'", (self.owner,)))
+
+    def states(self):
+        """the number of shards in each state, per collection"""
+        with self._lock:
+            rows = self._db.execute('SELECT collection, state, COUNT(*) FROM shards '
+                                    'GROUP BY collection, state').fetchall()
+        out = {}
+        for collection, state, count in rows:
+            out.setdefault(collection, {})[state] = count
+        return out
+
+    def start_heartbeat(self):
+        """renew the leases in the background, three times per lease"""
+        def beat():
+            while not self._stop.wait(self.lease / 3):
+                self.renew()
+        self._heartbeat = threading.Thread(target=beat, name='ledger-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def close(self):
+        """stop the heartbeat, give back unfinished shards and close the file"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.release()
+        with self._lock:
+            self._db.close()
+
+
+class ShardTracker:
+    """
+    Completes the shards of a `Ledger` once all their comics are processed,
+    not merely handed to the workers
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.active = {}  # shard: [comics handed out and not finished, all handed out]
+        self._lock = threading.Lock()
+
+    def started(self, shard):
+        """a comic of `shard` is handed out"""
+        with self._lock:
+            self.active.setdefault(shard, [0, False])[0] += 1
+
+    def exhausted(self, shard):
+        """all the comics of `shard` were handed out"""
+        with self._lock:
+            state = self.active.setdefault(shard, [0, False])
+            state[1] = True
+            finished = state[0] == 0
+            if finished:
+                del self.active[shard]
+        if finished:
+            self.ledger.complete(shard)
+
+    def finished(self, collection, number):
+        """comic `number` of `collection` is processed"""
+        with self._lock:
+            for shard, state in self.active.items():
+                if shard.collection == collection and shard.start <= number < shard.stop:
+                    state[0] -= 1
+                    finished = state[1] and state[0] == 0
+                    if finished:
+                        del self.active[shard]
+                    break
+            else:
+                return
+        if finished:
+            self.ledger.complete(shard)
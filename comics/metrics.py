@@ -0,0 +1,207 @@
+"""
+Defines opt-in instrumentation: per-collection phase timings and HTTP counters
+
+Nothing is recorded until `enable` is called. Measures are attributed to a
+collection from the domain of the url (or host) they concern, as registered
+with `register`, so that both engines and all threads share the same tallies.
+
+Phases are:
+    - enumerate: listing the comics of a collection (latest id, archives)
+    - metadata: fetching the pages describing a comic
+    - parse: extracting the metadata from those pages
+    - transfer: receiving pictures, disk writes excluded
+    - write: writing pictures, alt texts and index records to disk
+"""
+
+import json
+import threading
+import time
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+enabled = False
+
+_lock = threading.Lock()
+_domains = {}
+_seconds = defaultdict(float)  # (collection, phase): seconds
+_calls = Counter()  # (collection, phase): number of timed calls
+_bytes = Counter()  # collection: bytes received
+_statuses = Counter()  # (collection, status): responses
+_retries = Counter()  # collection: requests made again
+
+
+def enable(on=True):
+    """start (or stop) recording"""
+    global enabled
+    enabled = on
+
+
+def reset():
+    """forget everything recorded so far"""
+    with _lock:
+        for tally in (_seconds, _calls, _bytes, _statuses, _retries):
+            tally.clear()
+
+
+def register(collection, host):
+    """
+    attribute the measures about `host`'s domain (and its subdomains) to `collection`,
+    a collection without a `HOST` keeps its measures under their own domains
+    """
+    if host:
+        _domains[_domain(host)] = collection
+
+
+def _domain(host):
+    return '.'.join(host.split('.')[-2:])
+
+
+def collection_of(url):
+    """the collection a url (or bare host name) belongs to, else its domain"""
+    url = url or ''
+    host = urlsplit(url).hostname if '://' in url else url
+    domain = _domain(host or '')
+    return _domains.get(domain, domain)
+
+
+def add_time(url, phase, seconds):
+    """account for `seconds` spent in `phase` for `url`"""
+    if not enabled:
+        return
+    key = (collection_of(url), phase)
+    with _lock:
+        _seconds[key] += seconds
+        _calls[key] += 1
+
+
+@contextmanager
+def timed(url, phase):
+    """time the enclosed block as `phase` for `url`"""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(url, phase, time.perf_counter() - start)
+
+
+def count_response(url, status):
+    """account for a response of `status` to a request of `url`"""
+    if enabled:
+        with _lock:
+            _statuses[collection_of(url), status] += 1
+
+
+def count_bytes(url, size):
+    """account for `size` bytes received from `url`"""
+    if enabled:
+        with _lock:
+            _bytes[collection_of(url)] += size
+
+
+def count_retry(url):
+    """account for a request of `url` made again"""
+    if enabled:
+        with _lock:
+            _retries[collection_of(url)] += 1
+
+
+def snapshot():
+    """everything recorded so far, per collection, as a dict ready for json"""
+    with _lock:
+        collections = {name for name, _ in _seconds} | {name for name, _ in _statuses}
+        collections |= set(_bytes) | set(_retries)
+        out = {}
+        for name in sorted(collections):
+            out[name] = {
+                'phases': {phase: {'seconds': round(seconds, 6), 'calls': _calls[col, phase]}
+                           for (col, phase), seconds in sorted(_seconds.items()) if col == name},
+                'bytes': _bytes[name],
+                'statuses': {str(status): count
+                             for (col, status), count in sorted(_statuses.items(), key=str)
+                             if col == name},
+                'retries': _retries[name],
+            }
+    return out
+
+
+def to_json():
+    """the recorded measures as JSON"""
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def to_prometheus():
+    """the recorded measures in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, doc, samples):
+        lines.append('# HELP {} {}'.format(name, doc))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in samples:
+            label_text = ','.join('{}="{}"'.format(key, val) for key, val in labels)
+            lines.append('{}{{{}}} {}'.format(name, label_text, value))
+
+    data = snapshot()
+    metric('comics_phase_seconds_total', 'counter', 'Wall time spent per phase.',
+           [((('collection', name), ('phase', phase)), values['seconds'])
+            for name, record in data.items() for phase, values in record['phases'].items()])
+    metric('comics_phase_calls_total', 'counter', 'Timed calls per phase.',
+           [((('collection', name), ('phase', phase)), values['calls'])
+            for name, record in data.items() for phase, values in record['phases'].items()])
+    metric('comics_received_bytes_total', 'counter', 'Bytes received.',
+           [((('collection', name),), record['bytes']) for name, record in data.items()])
+    metric('comics_http_responses_total', 'counter', 'HTTP responses per status code.',
+           [((('collection', name), ('status', status)), count)
+            for name, record in data.items() for status, count in record['statuses'].items()])
+    metric('comics_retries_total', 'counter', 'Requests made again.',
+           [((('collection', name),), record['retries']) for name, record in data.items()])
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """
+    Runs functions under cProfile, with one profile per calling thread,
+    and merges them all when dumped
+
+    Examples:
+        >>> profiler = Profiler()
+        >>> process = profiler.wrap(process)
+        >>> ...  # call process from many threads
+        >>> profiler.dump('run.prof')
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        """`func`, profiled whenever it runs"""
+        def profiled(*args, **kwargs):
+            profile = getattr(self._local, 'profile', None)
+            if profile is None:
+                import cProfile  # only when profiling
+                profile = self._local.profile = cProfile.Profile()
+                with self._lock:
+                    self.profiles.append(profile)
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        return profiled
+
+    def dump(self, path):
+        """write the merged profiles to `path`, for `pstats` or snakeviz"""
+        with self._lock:
+            if not self.profiles:
+                return
+            import pstats
+            stats = pstats.Stats(self.profiles[0])
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+        stats.dump_stats(path)
@@ -0,0 +1,251 @@
+"""
+Defines a shared, connection-pooled HTTP session for all the comics collections
+
+Every request made by the package goes through `get`, so that connections
+are kept alive and reused across comics and worker threads. requests,
+slow to import, is only imported with the session, on the first request.
+"""
+
+import threading
+import time
+
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from . import metrics, parsing, retry
+from .scheduler import throttle_for
+from .utils import PartialDownload
+
+POOL_SIZE = 32  # connections kept per host, should match the number of workers
+POOL_HOSTS = 16  # number of hosts to keep a pool for
+TIMEOUT = 10
+CHUNK_SIZE = 64 * 1024  # bytes read at once when streaming images to disk
+USER_AGENT = 'comics-downloader/1.0 (+https://github.com/AlbericC/comics-downloader)'
+
+Page = namedtuple('Page', 'status_code content text headers')
+
+_lock = threading.Lock()
+_session = None
+_cache = None
+_counters = {'requests': 0, 'connections': 0}
+
+
+def _count(key):
+    with _lock:
+        _counters[key] += 1
+
+
+def _transient_errors():
+    """the failures of a request or of a transfer worth trying again, see `retry`"""
+    import requests
+    return requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError
+
+
+def configure(pool_size=None, user_agent=None, timeout=None, chunk_size=None):
+    """
+    Change the session settings.
+    The current session, if any, is dropped and a new one is made on next request.
+    """
+    global POOL_SIZE, USER_AGENT, TIMEOUT, CHUNK_SIZE, _session
+    with _lock:
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if user_agent is not None:
+            USER_AGENT = user_agent
+        if timeout is not None:
+            TIMEOUT = timeout
+        if chunk_size is not None:
+            CHUNK_SIZE = chunk_size
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def session():
+    """the shared session, made on first use"""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests  # slow to import, only when the first request is made
+            from .pools import PooledAdapter
+            adapter = PooledAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+            new = requests.Session()
+            new.mount('http://', adapter)
+            new.mount('https://', adapter)
+            new.headers['User-Agent'] = USER_AGENT
+            _session = new
+        return _session
+
+
+def get(url, **kwargs):
+    """
+    GET `url` with the shared session and the default timeout, within the host's limits.
+    Transient failures are retried after a backoff, see `retry`.
+    """
+    import requests
+    kwargs.setdefault('timeout', TIMEOUT)
+    throttle = throttle_for(urlsplit(url).hostname)
+    attempt = 0
+    while True:
+        throttle.acquire()
+        _count('requests')
+        headers = None
+        try:
+            resp = session().get(url, **kwargs)
+        except _transient_errors():
+            throttle.release(None)
+            if attempt >= retry.RETRIES:
+                raise
+        except requests.RequestException:
+            throttle.release(None)
+            raise
+        else:
+            throttle.release(resp.status_code)
+            metrics.count_response(url, resp.status_code)
+            if not retry.transient(resp.status_code) or attempt >= retry.RETRIES:
+                return resp
+            headers = resp.headers
+            resp.close()
+        attempt += 1
+        metrics.count_retry(url)
+        time.sleep(retry.delay(attempt, headers))
+
+
+def set_cache(cache):
+    """use `cache` (a `cache.HTTPCache`, or None) for metadata and listing pages"""
+    global _cache
+    _cache = cache
+
+
+def http_cache():
+    """the HTTP cache in use, or None"""
+    return _cache
+
+
+def cached_page(entry):
+    """a `Page` made from an HTTP cache entry"""
+    headers = {'ETag': entry.get('etag'), 'Last-Modified': entry.get('last_modified')}
+    return Page(200, entry['content'], _cache.text(entry), headers)
+
+
+def _cached_get(url):
+    """
+    GET `url` through the HTTP cache, return the response and the cache entry
+    holding its body, None if it was not stored
+    """
+    entry = _cache.lookup(url)
+    if entry is not None and _cache.fresh(entry):
+        return cached_page(entry), entry
+    resp = get(url, headers=_cache.request_headers(entry))
+    metrics.count_bytes(url, len(resp.content))
+    if resp.status_code == 304 and entry is not None:
+        _cache.refresh(url, entry)
+        return cached_page(entry), entry
+    if resp.status_code == 200:
+        return resp, _cache.store(url, resp.content, resp.headers)
+    return resp, None
+
+
+def get_page(url):
+    """
+    GET a metadata or listing page, through the HTTP cache if one is set:
+    fresh entries are used as is, others are revalidated with a conditional request.
+    """
+    if _cache is None:
+        resp = get(url)
+        metrics.count_bytes(url, len(resp.content))
+        return resp
+    return _cached_get(url)[0]
+
+
+def get_parsed(url, parse):
+    """
+    GET a metadata or listing page like `get_page`, return the response and
+    `parse(response)` (None unless its status is 200). With an HTTP cache, the
+    result (which must be JSON serializable) is kept beside the validators,
+    so a page still fresh or not modified is not parsed again.
+    """
+    if _cache is None:
+        resp = get_page(url)
+        return resp, parse(resp) if resp.status_code == 200 else None
+    resp, entry = _cached_get(url)
+    if entry is None:
+        return resp, None
+    if 'parsed' not in entry:
+        entry['parsed'] = parse(resp)
+        _cache.keep_parsed(url, entry, entry['parsed'])
+    return resp, entry['parsed']
+
+
+def download_to(url, target):
+    """
+    Stream `url` into the file `target`, which is only replaced once complete.
+    Interrupted transfers are kept aside and resumed with a Range request when
+    the server allows it, at once if they are retried. Return the status code of the response.
+    """
+    partial = PartialDownload(target, url)
+    headers = partial.request_headers()
+    start = time.perf_counter()
+    received = writing = attempt = 0
+    try:
+        while True:
+            resp = get(url, stream=True, headers=headers)
+            try:
+                status = resp.status_code
+                if headers and (status == 416 or status == 206 and not partial.resumes(resp.headers)):
+                    partial.discard()  # the range is not usable, fetch everything
+                    headers = {}
+                    metrics.count_retry(url)
+                    continue
+                if status not in (200, 206):
+                    return status
+                with partial.receiving(status, resp.headers) as part:
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        received += len(chunk)
+                        before = time.perf_counter()
+                        part.write(chunk)
+                        writing += time.perf_counter() - before
+                return 200
+            except _transient_errors():
+                if attempt >= retry.RETRIES:
+                    raise
+                attempt += 1
+                metrics.count_retry(url)
+                headers = partial.request_headers()  # resume from what was received
+                time.sleep(retry.delay(attempt))
+            finally:
+                resp.close()
+    finally:
+        metrics.count_bytes(url, received)
+        metrics.add_time(url, 'write', writing)
+        metrics.add_time(url, 'transfer', time.perf_counter() - start - writing)
+
+
+def drive(steps):
+    """
+    Run a fetching generator with the shared session and return its result.
+    `steps` yields urls, is sent back the responses, and returns the collected data.
+    It may also yield a `parsing.Job`, and is then sent back its result.
+    """
+    url = ''
+    try:
+        step = next(steps)
+        while True:
+            if isinstance(step, parsing.Job):
+                with metrics.timed(url, 'parse'):
+                    result = parsing.run(step)
+            else:
+                url = step
+                with metrics.timed(url, 'metadata'):
+                    result = get_page(url)
+            step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def stats():
+    """counters of requests made and connections opened or reused so far"""
+    with _lock:
+        out = dict(_counters)
+    out['reused'] = max(0, out['requests'] - out['connections'])
+    return out
@@ -0,0 +1,102 @@
+"""
+Defines the packing of a collection into CBZ volumes, for comic readers
+
+A CBZ is a zip of the pictures, in reading order. Pictures are stored as
+they are (they are compressed already), streamed from disk by `zipfile`,
+and their alt text files go along with them. Volumes are appended to:
+a run only adds the comics they do not hold yet, or whose files changed
+since (a repaired or downloaded again picture), rewriting the volume then.
+"""
+
+import os
+import time
+import zipfile
+import zlib
+
+from collections import defaultdict
+
+from .index import number_prefix
+
+PER = 100  # comics per volume
+
+
+def volume_key(class_, number, per=PER):
+    """
+    the name of the volume comic `number` of `class_` goes in: its year when `per`
+    is 'year' and the collection is dated, else its range of `per` numbers
+    """
+    if per == 'year':
+        if class_.DATED:
+            return str(class_.date_of(number).year)
+        per = PER
+    first = (number - 1) // per * per + 1
+    return '{:04}-{:04}'.format(first, first + per - 1)
+
+
+def open_volume(path):
+    """the volume at `path`, opened for appending; made again if a previous append broke it"""
+    try:
+        return zipfile.ZipFile(path, 'a', zipfile.ZIP_STORED)
+    except zipfile.BadZipFile:
+        os.remove(path)
+        return zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+
+
+def changed(info, path):
+    """true if the file at `path` differs from the volume entry `info`"""
+    if info.file_size != os.path.getsize(path):
+        return True
+    mtime = time.localtime(os.path.getmtime(path))
+    if info.date_time == mtime[:5] + (mtime[5] // 2 * 2,):  # zip times are to 2 seconds
+        return False  # same size, same time: not read again
+    crc = 0
+    with open(path, 'rb') as src:
+        for block in iter(lambda: src.read(1024 * 1024), b''):
+            crc = zlib.crc32(block, crc)
+    return crc != info.CRC
+
+
+def drop(path, names):
+    """rewrite the volume at `path` without its entries `names`"""
+    tmp = path + '.tmp'
+    with zipfile.ZipFile(path) as old, zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED) as new:
+        for info in old.infolist():
+            if info.filename not in names:
+                new.writestr(info, old.read(info))  # one picture at a time
+    os.replace(tmp, path)
+
+
+def pack(class_, dest, name, per=PER):
+    """
+    append the pictures (and alt texts) of the destination folder of `class_`
+    to the volumes `<name>-<key>.cbz` in the `dest` folder, see `volume_key`.
+    Entries whose file changed are replaced. Return the number of pictures added.
+    """
+    folder = class_.destination_folder
+    volumes = defaultdict(list)
+    for filename in sorted(os.listdir(folder)):
+        number = number_prefix(filename)
+        if number is not None and os.path.isfile(os.path.join(folder, filename)):
+            volumes[volume_key(class_, number, per)].append(filename)
+    os.makedirs(dest, exist_ok=True)
+    added = 0
+    for key, filenames in sorted(volumes.items()):
+        path = os.path.join(dest, '{}-{}.cbz'.format(name, key))
+        with open_volume(path) as volume:
+            packed = {info.filename: info for info in volume.infolist()}
+        stale = {entry for entry, info in packed.items()
+                 if os.path.isfile(os.path.join(folder, entry))
+                 and changed(info, os.path.join(folder, entry))}
+        if stale:
+            drop(path, stale)
+        with open_volume(path) as volume:
+            packed = set(packed).difference(stale)
+            for filename in filenames:
+                if filename not in packed:
+                    volume.write(os.path.join(folder, filename), filename)
+                    added += 1
+                alt_text = filename + '.txt'
+                if alt_text not in packed and os.path.isfile(os.path.join(folder, alt_text)):
+                    volume.write(os.path.join(folder, alt_text), alt_text,
+                                 compress_type=zipfile.ZIP_DEFLATED)
+    return added
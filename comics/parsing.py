@@ -0,0 +1,93 @@
+"""
+Defines the parsers of scraped comic pages, as plain functions
+
+Parsers only take and return plain data, with regexes compiled once, so
+they can run in a process pool (see `use_pool`) instead of the threads
+doing network I/O. Fetching generators (see `net.drive`) yield a `Job`
+to have their page parsed by the drivers.
+"""
+
+import html
+import re
+
+from collections import namedtuple
+
+Job = namedtuple('Job', 'func args')
+
+URL_TAIL = re.compile(r'[^ "]+')
+SMBC_IMG_TAG = re.compile(r'<img[^>]*?id="comic"[^>]*>')
+SMBC_TITLE = re.compile(r'title="(.*?)"')
+SMBC_SRC = re.compile(r'src="(.*?)"')
+SMBC_SECOND_IMG = re.compile(r"<img src='(http[^']*)'")
+COMMITSTRIP_TITLE = re.compile(r'<title>(.*) \|.*</title>')
+
+_pool = None
+
+
+def use_pool(workers):
+    """parse pages in a pool of `workers` processes, or in the calling thread if 0"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    if workers:
+        from concurrent.futures import ProcessPoolExecutor  # slow to import, seldom used
+        _pool = ProcessPoolExecutor(max_workers=workers)
+
+
+def run(job):
+    """run `job`, in the process pool if any"""
+    if _pool is None:
+        return job.func(*job.args)
+    return _pool.submit(job.func, *job.args).result()
+
+
+async def async_run(job, loop):
+    """run `job` from within the event `loop`, in the process pool if any"""
+    if _pool is None:
+        return job.func(*job.args)
+    return await loop.run_in_executor(_pool, job.func, *job.args)
+
+
+def links_after(text, prefix):
+    """
+    All the urls of `text` made of `prefix` and more url characters.
+    Same as `re.findall(prefix + '[^ "]+', text)`, without compiling a regex per prefix.
+    """
+    out = []
+    start = text.find(prefix)
+    while start != -1:
+        match = URL_TAIL.match(text, start + len(prefix))
+        if match is None:
+            start = text.find(prefix, start + 1)
+            continue
+        out.append(prefix + match.group(0))
+        start = text.find(prefix, match.end())
+    return out
+
+
+def parse_smbc_page(text, base_url):
+    """the metadata of a SMBC comic page"""
+    data = {}
+    imagetag = SMBC_IMG_TAG.findall(text)[0]
+    data['date'] = html.unescape(SMBC_TITLE.findall(imagetag)[0])
+    data['imgurl'] = base_url + SMBC_SRC.findall(imagetag)[0]
+    # second image if any ?
+    #  The sole <img> tag with src fully qualified is the button picture... bad way to do it.
+    button_img = SMBC_SECOND_IMG.search(text)
+    if button_img:
+        data['imgurl2'] = button_img.group(1)
+    return data
+
+
+def parse_commitstrip_datepage(text, url):
+    """the url of the comic page linked from the CommitStrip date page at `url`"""
+    return links_after(text, url)[0]
+
+
+def parse_commitstrip_comicpage(text, uploads_url):
+    """the metadata of a CommitStrip comic page, its pictures are under `uploads_url`"""
+    links = links_after(text, uploads_url)
+    matchintitle = COMMITSTRIP_TITLE.search(text)
+    title = html.unescape(matchintitle.groups()[0]).replace(' | CommitStrip', '')
+    return {'img-en': links[0], 'title': title, 'img-fr': links[1]}
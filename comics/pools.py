@@ -0,0 +1,44 @@
+"""
+Defines the transport of the `net` session, counting the connections it opens
+
+Kept apart from `net` since requests is slow to import: it is only
+imported with the session, when the first request is made.
+"""
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from . import net
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """HTTP connection pool that counts the connections it opens"""
+
+    def _new_conn(self):
+        net._count('connections')
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPS connection pool that counts the connections it opens"""
+
+    def _new_conn(self):
+        net._count('connections')
+        return super()._new_conn()
+
+
+COUNTING_POOLS = {'http': CountingHTTPConnectionPool, 'https': CountingHTTPSConnectionPool}
+
+
+class PooledAdapter(HTTPAdapter):
+    """Transport adapter using the counting connection pools, directly or through a proxy"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = COUNTING_POOLS
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if manager.pool_classes_by_scheme is not COUNTING_POOLS and not proxy.lower().startswith('socks'):
+            manager.pool_classes_by_scheme = COUNTING_POOLS  # SOCKS managers have their own pools
+        return manager
@@ -0,0 +1,82 @@
+"""
+Defines the registry of the comics collections, by name
+
+Collections are only imported when asked for, so that listing them, or
+getting a single one, does not pay for importing all the others. Other
+packages add collections by declaring an entry point in the
+`comics.collections` group, naming a `WebComic` subclass:
+
+    entry_points={'comics.collections': ['dilbert = dilbert_comics:DilbertComic']}
+
+Besides the abstract methods, such a class must set `HOST`, the host serving
+its pages (requests are throttled and measured by host), and its `iter_ids`
+must return a `range`: the newest first order reverses it, and the shards of
+a ledger are planned up to its `stop`.
+"""
+
+import importlib
+
+from collections import OrderedDict
+
+GROUP = 'comics.collections'
+
+# name: 'module:class' of the collections shipped with the package
+BUILTIN = OrderedDict([
+    ('xkcd', 'comics.xkcd:XKCDComic'),
+    ('sinfest', 'comics.sinfest:SinfestComic'),
+    ('commitstrip', 'comics.commitstrip:CommitStripComic'),
+    ('smbc', 'comics.smbc:SMBCComic'),
+])
+
+_plugins = None
+_loaded = {}
+
+
+def _entry_points():
+    """the entry points of GROUP, by name"""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # before python 3.8
+        try:
+            import pkg_resources
+        except ImportError:
+            return {}
+        return {point.name: point for point in pkg_resources.iter_entry_points(GROUP)}
+    points = entry_points()
+    if hasattr(points, 'select'):
+        points = points.select(group=GROUP)
+    else:  # before python 3.10
+        points = points.get(GROUP, ())
+    return {point.name: point for point in points}
+
+
+def plugins():
+    """the collections declared by other packages, as {name: entry point}, looked up once"""
+    global _plugins
+    if _plugins is None:
+        _plugins = OrderedDict((name, point) for name, point in sorted(_entry_points().items())
+                               if name not in BUILTIN)
+    return _plugins
+
+
+def names():
+    """the names of all the collections: the builtin ones first, then the plugins"""
+    return list(BUILTIN) + list(plugins())
+
+
+def target(name):
+    """the 'module:class' of collection `name`, without importing it"""
+    if name in BUILTIN:
+        return BUILTIN[name]
+    return plugins()[name].value
+
+
+def load(name):
+    """the class of collection `name`, imported on first use. KeyError if unknown"""
+    if name not in _loaded:
+        if name in BUILTIN:
+            module, _, attr = BUILTIN[name].partition(':')
+            _loaded[name] = getattr(importlib.import_module(module), attr)
+        else:
+            _loaded[name] = plugins()[name].load()
+    return _loaded[name]
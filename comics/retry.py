@@ -0,0 +1,53 @@
+"""
+Defines which failed requests are worth retrying, and how long to wait before
+
+Timeouts, dropped connections and the statuses of an overloaded or briefly
+failing server are transient: the request is made again, up to `RETRIES`
+times, after an exponential backoff with jitter (or the server's
+Retry-After). Anything else is permanent and reported at once.
+"""
+
+import random
+
+RETRIES = 3  # attempts after the first one
+BASE_DELAY = 0.5  # seconds before the first retry, doubled for each next one
+MAX_DELAY = 30.0
+TRANSIENT = (408, 425, 429, 500, 502, 503, 504)
+
+
+class HTTPStatusError(OSError):
+    """A request answered with a status meaning neither success nor a missing comic"""
+
+    def __init__(self, url, status):
+        super().__init__('{} answered {}'.format(url, status))
+        self.url = url
+        self.status = status
+
+
+def configure(retries=None, base_delay=None, max_delay=None):
+    """change the number of retries and the backoff delays"""
+    global RETRIES, BASE_DELAY, MAX_DELAY
+    if retries is not None:
+        RETRIES = retries
+    if base_delay is not None:
+        BASE_DELAY = base_delay
+    if max_delay is not None:
+        MAX_DELAY = max_delay
+
+
+def transient(status):
+    """true if a response of `status` is worth asking again"""
+    return status in TRANSIENT
+
+
+def delay(attempt, headers=None):
+    """
+    seconds to wait before retry number `attempt` (from 1): the Retry-After
+    of the failed response's `headers` when given in seconds, else between
+    half and all of the exponential backoff, so that workers spread out.
+    """
+    retry_after = (headers or {}).get('Retry-After', '')
+    if retry_after.isdigit():
+        return min(MAX_DELAY, float(retry_after))
+    backoff = min(MAX_DELAY, BASE_DELAY * 2 ** (attempt - 1))
+    return backoff / 2 + random.uniform(0, backoff / 2)
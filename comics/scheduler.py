@@ -0,0 +1,197 @@
+"""
+Defines per-host rate limits, and a scheduler feeding an executor from per-host queues
+
+Each host gets a token bucket (requests per second) and a concurrency limit.
+Both are halved when the host answers 429/503 or times out, and grow back
+towards their configured values after a run of successful requests.
+"""
+
+import threading
+import time
+
+from collections import Counter, OrderedDict, deque
+
+SLOW_DOWN = (429, 503)
+POLL = 0.05  # seconds to wait before trying again when a host is saturated
+
+# host: (requests per second, concurrent requests)
+HOSTS = {
+    'smbc-comics.com': (2, 4),
+    'www.smbc-comics.com': (2, 4),
+    'www.commitstrip.com': (2, 4),
+    'xkcd.com': (20, 16),
+    'www.xkcd.com': (20, 16),
+    'imgs.xkcd.com': (100, 64),
+    'www.sinfest.net': (20, 16),
+}
+DEFAULT = (10, 8)
+
+_lock = threading.Lock()
+_throttles = {}
+
+
+class TokenBucket:
+    """Classic token bucket, refilled at `rate` tokens per second"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def delay(self):
+        """take a token and return 0, or return the seconds to wait for one"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class HostThrottle:
+    """Rate and concurrency limits of a single host, adapting to its answers"""
+
+    def __init__(self, rate, limit):
+        self.max_rate = rate
+        self.max_limit = limit
+        self.limit = limit
+        self.bucket = TokenBucket(rate)
+        self.active = 0
+        self.successes = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """take a slot for a request and return 0, or return the seconds to wait"""
+        with self._lock:
+            if self.active >= self.limit:
+                return POLL
+            wait = self.bucket.delay()
+            if wait:
+                return wait
+            self.active += 1
+            return 0
+
+    def acquire(self):
+        """block until a request may be sent"""
+        wait = self.try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    def release(self, status=None):
+        """free the slot of a finished request. `status` is None on timeouts and errors"""
+        with self._lock:
+            self.active -= 1
+            if status is None or status in SLOW_DOWN:
+                self.limit = max(1, self.limit // 2)
+                self.bucket.rate = max(self.max_rate / 16, self.bucket.rate / 2)
+                self.successes = 0
+                return
+            self.successes += 1
+            if self.successes >= self.limit:  # sustained success, speed up
+                self.successes = 0
+                self.limit = min(self.max_limit, self.limit + 1)
+                self.bucket.rate = min(self.max_rate, self.bucket.rate * 1.25)
+
+
+def past(stop_at):
+    """true if the `time.time()` `stop_at` is given and has passed"""
+    return stop_at is not None and time.time() > stop_at
+
+
+def throttle_for(host):
+    """the shared throttle of `host`"""
+    with _lock:
+        if host not in _throttles:
+            _throttles[host] = HostThrottle(*HOSTS.get(host, DEFAULT))
+        return _throttles[host]
+
+
+def configure(host, rate, limit):
+    """set the rate (requests/s) and concurrency limits of `host`"""
+    with _lock:
+        HOSTS[host] = (rate, limit)
+        _throttles.pop(host, None)
+
+
+class Scheduler:
+    """
+    Feeds an executor from one queue per host (the `work_host` of the items), round-robin,
+    keeping each host's work in flight within its current concurrency limit.
+    Items are pulled lazily, at most `backlog` of them wait in the queues.
+
+    Examples:
+        >>> scheduler = Scheduler(ThreadPoolExecutor(max_workers=32), process, workers=32)
+        >>> scheduler.run(comics, done=lambda comic, future: print(future.result()))
+    """
+
+    def __init__(self, executor, func, workers, backlog=None):
+        self.executor = executor
+        self.func = func
+        self.workers = workers
+        self.backlog = backlog or 4 * workers
+        self._cond = threading.Condition()
+        self._in_flight = Counter()
+
+    def run(self, items, done=None, stop_at=None):
+        """
+        apply `func` to all `items` and wait for completion.
+        `done` is called with each item and its future. Once `stop_at` (a `time.time()`)
+        passes, if given, no item is pulled or submitted any more: return those left
+        in the queues, in the order they were pulled host by host.
+        """
+        items = iter(items)
+        queues = OrderedDict()
+        exhausted = False
+        while True:
+            # pull new items outside of the lock, enumerating may need the network
+            incoming = []
+            with self._cond:
+                room = self.backlog - sum(len(queue) for queue in queues.values())
+            while not exhausted and len(incoming) < room and not past(stop_at):
+                try:
+                    incoming.append(next(items))
+                except StopIteration:
+                    exhausted = True
+            with self._cond:
+                for item in incoming:
+                    queues.setdefault(item.work_host, deque()).append(item)
+                late = past(stop_at)
+                if not sum(self._in_flight.values()) and (late or exhausted and not any(queues.values())):
+                    return [item for queue in queues.values() for item in queue]
+                if not self._fill(queues, done, stop_at):
+                    self._cond.wait(POLL)
+
+    def _fill(self, queues, done, stop_at=None):
+        """
+        submit what the limits allow (lock held) until `stop_at` passes,
+        return the number of submitted items
+        """
+        submitted = 0
+        progress = True
+        while progress:  # one item per host and per round, to interleave hosts
+            progress = False
+            for host, queue in queues.items():
+                if not queue or sum(self._in_flight.values()) >= self.workers:
+                    continue
+                if self._in_flight[host] >= throttle_for(host).limit:
+                    continue
+                if past(stop_at):
+                    return submitted
+                item = queue.popleft()
+                self._in_flight[host] += 1
+                future = self.executor.submit(self.func, item)
+                future.add_done_callback(
+                    lambda fut, host=host, item=item: self._finished(item, fut, host, done))
+                submitted += 1
+                progress = True
+        return submitted
+
+    def _finished(self, item, future, host, done):
+        with self._cond:
+            self._in_flight[host] -= 1
+            self._cond.notify()
+        if done is not None:
+            done(item, future)
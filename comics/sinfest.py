@@ -19,9 +19,13 @@ class SinfestComic(WebComic):
 
     """
 
+    __slots__ = ()
     BASE_URL = "http://www.sinfest.net/btphp/comics/"
+    FIRST = date(2000, 1, 17)
     EXTENSION = '.gif'
+    DATED = True
     destination_folder = None
+    HOST = 'www.sinfest.net'
 
     @staticmethod
     def latest_id():
@@ -29,31 +33,34 @@ class SinfestComic(WebComic):
         today = date.today()
         return today.isoformat()
 
-    @staticmethod
-    def first_id():
+    @classmethod
+    def first_id(cls):
         """return the uid of the first comic in this collection"""
-        return date(2000, 1, 17).isoformat()
+        return cls.FIRST.isoformat()
 
     @classmethod
-    def all(cls):
-        """prepare and return a list of all the currently existing comics"""
-        out = []
-        day = date(2000, 1, 17)
-        num = 1
-        today = date.today()
-        while day <= today:
-            out.append(SinfestComic(num))
-            day += timedelta(days=1)
-            num += 1
-        return out
+    def iter_ids(cls, start=1):
+        """the numbers of all the currently existing comics, from number `start`"""
+        return range(max(start, 1), cls.number_of(date.today()) + 1)
+
+    @classmethod
+    def date_of(cls, number):
+        """the publication day of comic `number`"""
+        return cls.FIRST + timedelta(days=number - 1)
+
+    @classmethod
+    def number_of(cls, day):
+        """the number of the comic published on `day`"""
+        return (day - cls.FIRST).days + 1
 
     def __init__(self, number):
         """Make a WebComic object"""
         super().__init__(number)
-        firstdate = self.first_id()
-        this_date = date(*[int(n) for n in firstdate.split('-')]) +\
-            timedelta(days=number - 1)
-        self.uid = this_date.isoformat()
+
+    @property
+    def uid(self):
+        """the publication day of this comic"""
+        return self.date_of(self.number).isoformat()
 
     def __str__(self):
         return "Sinfest webcomic: {}".format(self.uid)
@@ -21,25 +21,25 @@
 # this script uses regexes instead of a html parser, as we are looking for few, punctual data.
 
 import re
-import html
-
-import requests
 
+from . import net
+from .parsing import Job, parse_smbc_page
+from .retry import HTTPStatusError
 from .webcomic import WebComic
 
 
 class SMBCComic(WebComic):
     """Class for SMBC webcomics"""
 
+    __slots__ = ()
     destination_folder = None
+    HOST = 'smbc-comics.com'
     latest = None
-    IMG_TAG_REG = re.compile('<img.*?id="comic".*?>')
     BASE_URL = 'http://smbc-comics.com/'
 
     def __init__(self, number):
         """Make a SMBC WebComic object"""
         super().__init__(number)
-        self.data = {}
 
     @classmethod
     def latest_id(cls):
@@ -47,9 +47,14 @@ class SMBCComic(WebComic):
         if cls.latest is not None:
             return cls.latest
         latest_regex = r'<a href=".*?\?id=(\d+)" class="last"'
-        firstpage = requests.get('http://smbc-comics.com/index.php?id=1', timeout=10)
-        matching = re.search(latest_regex, firstpage.text).groups()[0]
-        cls.latest = int(matching)
+        url = 'http://smbc-comics.com/index.php?id=1'
+        firstpage, matching = net.get_parsed(url, lambda firstpage: re.findall(latest_regex,
+                                                                               firstpage.text))
+        if firstpage.status_code != 200:
+            raise HTTPStatusError(url, firstpage.status_code)
+        if not matching:
+            raise ValueError('no link to the latest comic in ' + url)
+        cls.latest = int(matching[0])
         return cls.latest
 
     @staticmethod
@@ -58,10 +63,10 @@ class SMBCComic(WebComic):
         return 1
 
     @classmethod
-    def all(cls):
-        """ return an iterable of all the currently
-        available comics form this collection """
-        return [cls(num) for num in range(cls.first_id(), cls.latest_id() + 1)]
+    def iter_ids(cls, start=1):
+        """ return an iterable of the numbers of all the currently
+        available comics form this collection, from number `start` """
+        return range(max(start, cls.first_id()), cls.latest_id() + 1)
 
     def __str__(self):
         return "SMBC Webcomic {}".format(self.number)
@@ -69,20 +74,17 @@ class SMBCComic(WebComic):
     def __repr__(self):
         return str(self)
 
-    def ensure_data(self):
-        """Make sure data is collected from the net"""
-        if self.data:
-            return self.data
-        comicpage = requests.get('http://smbc-comics.com/index.php?id={}'.format(self.number))
-        imagetag = re.findall(self.IMG_TAG_REG, comicpage.text)[0]
-        self.data['date'] = html.unescape(re.findall('title="(.*?)"', imagetag)[0])
-        self.data['imgurl'] = self.BASE_URL + re.findall('src="(.*?)"', imagetag)[0]
-        # second image if any ?
-        button_img = re.findall("<img src='(http.*?)'.*?>", comicpage.text)  # no good, but meh
-        #  The sole <img> tag with src fully qualified is the button picture... bad way to do it.
-        if button_img:  # found one (or more)
-            self.data['imgurl2'] = button_img[0]
-        return self.data
+    def fetch_data(self):
+        """Generator of the requests needed to get the data, see `net.drive`"""
+        url = 'http://smbc-comics.com/index.php?id={}'.format(self.number)
+        comicpage = yield url
+        if comicpage.status_code in self.MISSING:
+            self.record_gap(comicpage.status_code)
+            return None
+        if comicpage.status_code != 200:
+            raise HTTPStatusError(url, comicpage.status_code)
+        data = yield Job(parse_smbc_page, (comicpage.text, self.BASE_URL))
+        return data
 
     @property
     def alt_text(self):
@@ -115,18 +117,25 @@ class SMBCComic(WebComic):
             return
         return self.utitle + '_a.' + self.data['imgurl'].split('.')[-1]
 
-    def download(self):
-        out = [super().download()]
-        # also get te second image (if any)
-        if out[0] is None:
-            return
-        if 'imgurl2' in self.data:
-            src = requests.get(self.data['imgurl2'], timeout=10)
-            if src.status_code != 200:
-                return
-            targetfilename = self.utitle + '_b.' + self.data['imgurl2'].split('.')[-1]
-            target = self.destination_folder.joinpath(targetfilename)
-            with open(target, 'wb') as dest:
-                dest.write(src.content)
-            out.append(target)
+    def pictures(self):
+        """the filenames of the pictures of this comic, the second one if any"""
+        out = [self.filename]
+        if self.ensure_data() and 'imgurl2' in self.data:
+            out.append(self.second_target().name)
         return out
+
+    def extra_pictures(self):
+        """the second picture of this comic, if any and still to fetch"""
+        if self.destination_folder is None or not self.ensure_data() or 'imgurl2' not in self.data:
+            return []
+        target = self.second_target()
+        return [] if target.isfile() else [(self.data['imgurl2'], target)]
+
+    async def async_extra_pictures(self):
+        await self.async_ensure_data()
+        return self.extra_pictures()
+
+    def second_target(self):
+        """where to write the second picture of this comic"""
+        targetfilename = self.utitle + '_b.' + self.data['imgurl2'].split('.')[-1]
+        return self.destination_folder.joinpath(targetfilename)
@@ -0,0 +1,65 @@
+"""
+Defines snapshots: the metadata of every indexed comic, in one compressed file
+
+A snapshot made on one machine pre-populates the indexes of another, so
+that its comics have their metadata (xkcd JSON, parsed SMBC and CommitStrip
+pages) before the first request, and only their pictures are fetched.
+"""
+
+import gzip
+import json
+
+FORMAT = 'comics-snapshot'
+VERSION = 1
+
+
+def export(path, classes):
+    """
+    write the index records of the collections `classes` ({name: class}) to `path`,
+    gzipped JSON lines. Return the number of records written.
+    """
+    count = 0
+    with gzip.open(path, 'wt', compresslevel=6) as dest:
+        dest.write(json.dumps({'format': FORMAT, 'version': VERSION}) + '\n')
+        for name, class_ in sorted(classes.items()):
+            if class_.index is None:
+                continue
+            for number in sorted(class_.index.records):
+                line = {'collection': name, 'record': class_.index.records[number]}
+                dest.write(json.dumps(line, sort_keys=True) + '\n')
+                count += 1
+    return count
+
+
+def records(path):
+    """yield the (collection name, index record) pairs of the snapshot at `path`"""
+    with gzip.open(path, 'rt') as src:
+        header = json.loads(next(src, '{}'))
+        if header.get('format') != FORMAT or header.get('version', 0) > VERSION:
+            raise ValueError('{}: not a comics snapshot this version can read'.format(path))
+        for line in src:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line truncated by an interrupted export
+            yield entry['collection'], entry['record']
+
+
+def load(path, classes):
+    """
+    add the records of the snapshot at `path` to the indexes of the collections
+    `classes` ({name: class}), unless they already know these comics with their metadata.
+    Return the number of records added per collection.
+    """
+    new = {name: [] for name in classes}
+    for name, record in records(path):
+        class_ = classes.get(name)
+        if class_ is None or class_.index is None:
+            continue
+        known = class_.index.get(record['number'])
+        if known is None or not known.get('data') and record.get('data'):
+            new[name].append(record)
+    for name, found in new.items():
+        if found:
+            classes[name].index.extend(found)
+    return {name: len(found) for name, found in new.items()}
@@ -0,0 +1,219 @@
+"""
+Small helpers shared by the comics modules
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+
+from contextlib import contextmanager
+
+from path import Path
+
+
+@contextmanager
+def atomic_write(target, mode='wb'):
+    """
+    Context manager giving a file that replaces `target` only if the block succeeds
+
+    Data goes to a hidden temporary file in the same folder, which is synced
+    then renamed, so `target` is never seen half written.
+    """
+    folder, name = os.path.split(target)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.' + name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as dest:
+            yield dest
+            dest.flush()
+            os.fsync(dest.fileno())
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class RecordFile:
+    """
+    Records kept in memory by their `KEY` field, and as JSON lines appended to
+    a file of `folder`
+
+    When a key appears several times, the last line wins. If `VALUE` is set, a
+    line where that field is None takes the key out (see `discard`). Lines
+    truncated by an interrupted run are ignored, and ended before appending.
+    """
+
+    FILENAME = None
+    KEY = 'number'
+    VALUE = None
+
+    def __init__(self, folder):
+        """Open (and load) the records of `folder`"""
+        self.folder = Path(folder).expand().abspath()
+        self.path = self.folder.joinpath(self.FILENAME)
+        self.records = {}
+        self._lock = threading.Lock()
+        self._unterminated = False  # the file ends with a truncated line
+        self.load()
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def load(self):
+        """read the records from disk, if any"""
+        self.records = {}
+        self._unterminated = False
+        if not self.path.isfile():
+            return
+        with open(self.path) as src:
+            for line in src:
+                self._unterminated = not line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line truncated by an interrupted run
+                if self.VALUE is not None and record.get(self.VALUE) is None:
+                    self.records.pop(record[self.KEY], None)
+                else:
+                    self.records[record[self.KEY]] = record
+
+    def get(self, key):
+        """the record of `key`, or None"""
+        return self.records.get(key)
+
+    def _append(self, records):
+        """append `records` to the file (lock held), after ending a truncated last line"""
+        with open(self.path, 'a') as dest:
+            if self._unterminated:
+                dest.write('\n')
+                self._unterminated = False
+            for record in records:
+                dest.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def put(self, *records):
+        """register `records` and append them to the file, in one go"""
+        with self._lock:
+            for record in records:
+                self.records[record[self.KEY]] = record
+            self._append(records)
+
+    def discard(self, key):
+        """forget the record of `key`, if any"""
+        with self._lock:
+            if self.records.pop(key, None) is not None:
+                self._append([{self.KEY: key, self.VALUE: None}])
+
+
+class PartialDownload:
+    """
+    A download kept in a hidden `.part` file next to its target, along with a journal
+    of the bytes received and the validators (ETag / Last-Modified) of the response,
+    so that an interrupted transfer can be resumed with a Range request.
+    The journal is saved every `CHECKPOINT` bytes, once they are synced to disk,
+    so a transfer killed along with its process resumes as well.
+
+    Examples:
+        >>> partial = PartialDownload('/tmp/0001-comic.png', url)
+        >>> resp = requests.get(url, headers=partial.request_headers(), stream=True)
+        >>> with partial.receiving(resp.status_code, resp.headers) as part:
+                for chunk in resp.iter_content(65536):
+                    part.write(chunk)
+    """
+
+    CHECKPOINT = 1024 * 1024  # bytes received between two saves of the journal
+
+    def __init__(self, target, url):
+        folder, name = os.path.split(target)
+        self.target = target
+        self.url = url
+        self.part = os.path.join(folder, '.' + name + '.part')
+        self.journal = self.part + '.json'
+        self.received = 0
+        self.validator = None
+        self._dest = None
+        self._saved = 0  # bytes received as of the last save of the journal
+        self._load()
+
+    def _load(self):
+        """pick up an earlier attempt, if it was for the same url"""
+        try:
+            with open(self.journal) as src:
+                journal = json.load(src)
+            size = os.path.getsize(self.part)
+        except (OSError, ValueError):
+            return
+        if journal.get('url') != self.url:
+            return
+        self.received = min(size, journal.get('received', 0))
+        self.validator = journal.get('validator')
+
+    def _save(self):
+        with atomic_write(self.journal, 'w') as dest:
+            json.dump({'url': self.url, 'received': self.received,
+                       'validator': self.validator}, dest)
+        self._saved = self.received
+
+    def _checkpoint(self):
+        """sync what was received and save the journal accordingly"""
+        self._dest.flush()
+        os.fsync(self._dest.fileno())
+        self._save()
+
+    def request_headers(self):
+        """the headers asking for the missing bytes only, if resuming is possible"""
+        if not self.received or not self.validator:
+            return {}
+        return {'Range': 'bytes={}-'.format(self.received), 'If-Range': self.validator}
+
+    def resumes(self, headers):
+        """true if a 206 response with `headers` continues exactly where we stopped"""
+        match = re.match(r'bytes (\d+)-', headers.get('Content-Range', ''))
+        return match is not None and int(match.group(1)) == self.received
+
+    def discard(self):
+        """forget the earlier attempt"""
+        self.received = 0
+        self.validator = None
+        for path in (self.part, self.journal):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @contextmanager
+    def receiving(self, status, headers):
+        """
+        Context manager to write the body of a response with `status` and `headers`.
+        On success the part file replaces the target, otherwise it is kept for later.
+        """
+        if status != 206:
+            self.received = 0  # full content, start over
+        etag = headers.get('ETag')
+        if etag and etag.startswith('W/'):
+            etag = None  # weak validators cannot be used with If-Range
+        previous = self.validator if status == 206 else None
+        self.validator = etag or headers.get('Last-Modified') or previous
+        self._save()
+        with open(self.part, 'r+b' if self.received else 'wb') as dest:
+            dest.seek(self.received)
+            dest.truncate()
+            self._dest = dest
+            try:
+                yield self
+            except BaseException:
+                self._checkpoint()
+                raise
+            dest.flush()
+            os.fsync(dest.fileno())
+        os.replace(self.part, self.target)
+        os.remove(self.journal)
+
+    def write(self, chunk):
+        """append `chunk` to the part file"""
+        self._dest.write(chunk)
+        self.received += len(chunk)
+        if self.received - self._saved >= self.CHECKPOINT:
+            self._checkpoint()
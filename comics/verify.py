@@ -0,0 +1,102 @@
+"""
+Defines the integrity checks of the pictures already in a collection folder
+
+Pictures are read through memory maps: only their first and last bytes are
+touched, so whole archives are checked quickly. A picture is corrupt when it
+is empty, is not a known image format (often an HTML error page), has a
+broken header, lacks its format's trailer (truncated), or differs in size
+from what the index recorded.
+"""
+
+import mmap
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .index import number_prefix
+
+QUARANTINE = '.corrupt'
+
+
+def _png(data):
+    if data[12:16] != b'IHDR' or not any(data[16:24]):
+        return 'broken PNG header'
+    if data.rfind(b'IEND', max(0, len(data) - 64)) == -1:
+        return 'truncated PNG'
+
+
+def _gif(data):
+    if len(data) < 13 or not any(data[6:10]):
+        return 'broken GIF header'
+    if data[len(data) - 1:] != b';':
+        return 'truncated GIF'
+
+
+def _jpeg(data):
+    if len(data) < 4 or not 0xc0 <= data[3] <= 0xfe:
+        return 'broken JPEG header'
+    if data.rfind(b'\xff\xd9', max(0, len(data) - 1024)) == -1:
+        return 'truncated JPEG'
+
+
+FORMATS = (
+    (b'\x89PNG\r\n\x1a\n', _png),
+    (b'GIF87a', _gif),
+    (b'GIF89a', _gif),
+    (b'\xff\xd8\xff', _jpeg),
+)
+
+
+def check(path, size=None):
+    """why the picture at `path` is corrupt, or None if it looks sound. `size` is its expected size"""
+    try:
+        actual = os.path.getsize(path)
+        if actual == 0:
+            return 'empty file'
+        if size is not None and actual != size:
+            return 'size {} instead of {}'.format(actual, size)
+        with open(path, 'rb') as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for magic, checker in FORMATS:
+                if data[:len(magic)] == magic:
+                    return checker(data)
+            if data[:64].lstrip()[:1] == b'<':
+                return 'HTML page instead of a picture'
+            return 'unknown picture format'
+    except (OSError, ValueError) as error:
+        return 'unreadable: {}'.format(error)
+
+
+def scan(folder, index=None, workers=8):
+    """
+    check all the pictures of `folder` in parallel, against the sizes in `index` if any.
+    Return {comic number: {filename: reason}} for the corrupt ones.
+    """
+    names = [name for name in os.listdir(folder)
+             if number_prefix(name) is not None and os.path.isfile(os.path.join(folder, name))]
+
+    def expected_size(name):
+        record = index.get(number_prefix(name)) if index is not None else None
+        if record is None or record.get('filename') != name:
+            return None
+        return record.get('size')
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reasons = executor.map(lambda name: check(os.path.join(folder, name), expected_size(name)),
+                               names)
+        corrupt = {}
+        for name, reason in zip(names, reasons):
+            if reason is not None:
+                corrupt.setdefault(number_prefix(name), {})[name] = reason
+    return corrupt
+
+
+def quarantine(folder, numbers):
+    """move all the pictures of the comics `numbers` out of `folder`, into its QUARANTINE subfolder"""
+    aside = os.path.join(folder, QUARANTINE)
+    os.makedirs(aside, exist_ok=True)
+    moved = []
+    for name in os.listdir(folder):
+        if number_prefix(name) in numbers and os.path.isfile(os.path.join(folder, name)):
+            os.replace(os.path.join(folder, name), os.path.join(aside, name))
+            moved.append(name)
+    return moved
@@ -4,16 +4,36 @@ Defines an abstract class for webcomics
 
 
 import abc
+import json
+import os
 
-import requests
+from urllib.parse import urlsplit
 
 from path import Path
 
+from . import metrics, net
+from .failures import FailureQueue
+from .gaps import GapCache
+from .index import ComicIndex, number_prefix
+from .retry import HTTPStatusError
+from .utils import atomic_write
+
 
 class WebComic(metaclass=abc.ABCMeta):
     """Class for webcomics"""
 
+    # instances are made for every comic of a collection, keep them small
+    __slots__ = ('number', 'data')
     destination_folder = None
+    index = None
+    present = frozenset()  # numbers with a picture in the destination folder, scanned once
+    HOST = None  # the host serving this collection's pages, for rate limiting
+    DATED = False  # true for collections with one number per calendar day, see `date_of`
+    MISSING = (404, 410)  # statuses meaning there is no such comic
+    gaps = None
+    failures = None
+    blobs = None  # a `blobs.BlobStore` shared by all collections, if any
+    WATERMARK_FILE = '.watermark.json'
 
     @staticmethod
     @abc.abstractmethod
@@ -27,12 +47,29 @@ class WebComic(metaclass=abc.ABCMeta):
 
     @classmethod
     @abc.abstractmethod
-    def all(cls):
+    def iter_ids(cls, start=1):
         """
-        return an iterable of all the currently
-        available comics form this collection
+        return a `range` of the numbers of all the currently
+        available comics form this collection, from number `start`
         """
 
+    @classmethod
+    def iter_comics(cls, start=1, newest_first=False):
+        """lazily yield the comics of this collection, from number `start` (or down to it)"""
+        numbers = cls.iter_ids(start)
+        if newest_first:
+            numbers = reversed(numbers)
+        for number in numbers:
+            yield cls(number)
+
+    @classmethod
+    def all(cls, start=1):
+        """
+        return a list of all the currently
+        available comics form this collection, from number `start`
+        """
+        return list(cls.iter_comics(start))
+
     @classmethod
     def set_destination(cls, path):
         """register this path as the destination for upcoming downloads"""
@@ -40,11 +77,114 @@ class WebComic(metaclass=abc.ABCMeta):
         if not path.isdir():
             path.makedirs()
         cls.destination_folder = path
+        cls.index = ComicIndex(path)
+        cls.present = cls.scan(path)
+        cls.failures = FailureQueue(path)
+        if cls.DATED:
+            cls.gaps = GapCache(path)
+
+    @classmethod
+    def scan(cls, folder):
+        """
+        the numbers of the comics with a picture in `folder`, listed in one go, see `present`.
+        Those the index shows with one of their `pictures` missing are left out.
+        """
+        names = cls.listing(folder)
+        numbers = (number_prefix(name) for name in names)
+        return frozenset(number for number in numbers
+                         if number is not None and cls.complete(number, names))
+
+    @classmethod
+    def listing(cls, folder):
+        """the names of the files of `folder`, as given by `pictures`"""
+        return set(os.listdir(folder))
+
+    @classmethod
+    def complete(cls, number, names):
+        """false if the index record of comic `number` names a picture missing from `names`"""
+        record = cls.index.get(number) if cls.index is not None else None
+        if record is None or not record.get('data'):
+            return True  # nothing tells which pictures it has
+        comic = cls(number)
+        comic.load_record(record)
+        return all(name in names for name in comic.pictures())
+
+    @classmethod
+    def rebuild_index(cls):
+        """rebuild the metadata index from the files in the destination folder"""
+        if cls.index is None:
+            return 0
+        return cls.index.rebuild()
+
+    @classmethod
+    def on_disk(cls, number):
+        """true if comic `number` had a picture in the destination folder when it was set"""
+        return number in cls.present
+
+    @classmethod
+    def known_gap(cls, number):
+        """true if comic `number` is known to be missing, and not worth a request"""
+        return cls.gaps is not None and cls.gaps.confirmed(number)
+
+    @classmethod
+    def failed_comics(cls):
+        """the comics whose download failed in previous runs"""
+        if cls.failures is None:
+            return
+        for number in cls.failures.numbers():
+            yield cls(number)
+
+    @classmethod
+    def watermark(cls):
+        """the number of the last comic fetched by a previous run, or None"""
+        if cls.destination_folder is None:
+            return None
+        path = cls.destination_folder.joinpath(cls.WATERMARK_FILE)
+        try:
+            with open(path) as src:
+                return json.load(src)['number']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None  # none yet, or written by an interrupted run
+
+    @classmethod
+    def update_watermark(cls):
+        """record the highest comic number on disk or in the index as the watermark"""
+        if cls.index is None:
+            return None
+        number = None
+        # index records may come from a snapshot, only count those with their file
+        for known in sorted(cls.present.union(cls.index.records), reverse=True):
+            record = cls.index.get(known)
+            if known in cls.present or cls.destination_folder.joinpath(record['filename']).isfile():
+                number = known
+                break
+        if number is None:
+            return None
+        with atomic_write(cls.destination_folder.joinpath(cls.WATERMARK_FILE), 'w') as dest:
+            json.dump({'number': number, 'uid': str(cls(number).uid)}, dest)
+        return number
 
     @abc.abstractmethod
     def __init__(self, number):
         """Make a WebComic object"""
         self.number = number
+        self.data = ''  # not fetched yet, see `ensure_data`
+
+    @property
+    def uid(self):
+        """the identifier of this comic on its website"""
+        return self.number
+
+    @property
+    def work_host(self):
+        """
+        the host limiting the work left on this comic: that of its picture when
+        the index already has its metadata (no page to fetch), else `HOST`
+        """
+        record = self.index.get(self.number) if self.index is not None else None
+        if record is not None and record.get('data') and record.get('image_url'):
+            return urlsplit(record['image_url']).hostname
+        return self.HOST
 
     @abc.abstractmethod
     def __str__(self):
@@ -78,31 +218,201 @@ class WebComic(metaclass=abc.ABCMeta):
         return '{:>04}-{}'.format(self.number, self.title)
 
     def download(self):
-        """download the picture"""
+        """download the picture, and the other pictures of this comic still missing"""
+        out = None
+        if self.wants_download():
+            target = self.destination_folder.joinpath(self.filename)
+            status = self.fetch_picture(self.image_url, target)
+            if status != 200:
+                if status in self.MISSING:
+                    self.record_gap(status)
+                    return
+                raise HTTPStatusError(self.image_url, status)
+            out = self.saved()
+        extras = []
+        for url, target in self.extra_pictures():
+            status = self.fetch_picture(url, target)
+            if status != 200:
+                raise HTTPStatusError(url, status)
+            extras.append(target)
+        return self.fetched(out, extras)
+
+    async def async_download(self):
+        """download the pictures, from within the asyncio engine"""
         if self.destination_folder is None:
-            # quick abort download if destination was never set
             return None
-        if not self.has_target(self.destination_folder) or not self.image_url:
-            return
-        src = requests.get(self.image_url, timeout=10)
-        if src.status_code == 404 or src.status_code != 200:
-            src.close()
-            return  # missing or network error or whatever
-        with open(self.destination_folder.joinpath(self.filename), 'wb') as dest:
-            dest.write(src.content)
-        src.close()
-        if self.alt_text:
-            with open(self.destination_folder.joinpath(self.filename) + '.txt', 'w') as dest:
-                dest.write(self.alt_text)
+        if not self.known_on_disk(self.destination_folder):
+            await self.async_ensure_data()
+        out = None
+        if self.wants_download():
+            target = self.destination_folder.joinpath(self.filename)
+            status = await self.async_fetch_picture(self.image_url, target)
+            if status != 200:
+                if status in self.MISSING:
+                    self.record_gap(status)
+                    return
+                raise HTTPStatusError(self.image_url, status)
+            out = self.saved()
+        extras = []
+        for url, target in await self.async_extra_pictures():
+            status = await self.async_fetch_picture(url, target)
+            if status != 200:
+                raise HTTPStatusError(url, status)
+            extras.append(target)
+        return self.fetched(out, extras)
+
+    def fetched(self, out, extras):
+        """
+        the result of a download: the path of the main picture `out` (or None),
+        or a list of all the paths written when `extras` were fetched too
+        """
+        if not extras:
+            return out
+        if out is None and self.index is not None:
+            self.index.add(self.to_record())  # keep the metadata telling those pictures
+        return ([out] if out is not None else []) + extras
+
+    def fetch_picture(self, url, target):
+        """
+        download `url` into `target` and return the status, 200 on success.
+        Through the blob store if any: pictures are linked when their url is known.
+        """
+        if self.blobs is not None and self.blobs.link(url, target):
+            return 200
+        status = net.download_to(url, target)
+        if status == 200 and self.blobs is not None:
+            self.blobs.adopt(target, url)
+        return status
+
+    async def async_fetch_picture(self, url, target):
+        """asynchronous version of `fetch_picture`"""
+        if self.blobs is not None and self.blobs.link(url, target):
+            return 200
+        from . import aio  # loaded by the asyncio engine only
+        status = await aio.download_to(url, target)
+        if status == 200 and self.blobs is not None:
+            self.blobs.adopt(target, url)
+        return status
+
+    def fetch_data(self):
+        """
+        Generator of the requests needed to get the metadata of this comic, see `net.drive`.
+        None by default, for comics described by their number alone.
+        """
+        return None
+        yield
+
+    def ensure_data(self):
+        """collect the metadata of this comic if not done yet and return it, None if missing"""
+        if self.data != '':
+            return self.data
+        self.data = net.drive(self.fetch_data())
+        return self.data
+
+    async def async_ensure_data(self):
+        """asynchronous version of `ensure_data`"""
+        if self.data != '':
+            return self.data
+        from . import aio  # loaded by the asyncio engine only
+        self.data = await aio.drive(self.fetch_data())
+        return self.data
+
+    def pictures(self):
+        """the filenames of all the pictures of this comic, in its destination folder"""
+        return [self.filename]
+
+    def extra_pictures(self):
+        """(url, target) of the pictures of this comic besides the main one still to fetch"""
+        return []
+
+    async def async_extra_pictures(self):
+        """asynchronous version of `extra_pictures`"""
+        return self.extra_pictures()
+
+    def wants_download(self):
+        """true if the picture should be fetched now"""
+        if self.destination_folder is None:
+            # quick abort download if destination was never set
+            return False
+        if not self.has_target(self.destination_folder):
+            self.remember()
+            return False
+        return bool(self.image_url)
+
+    def saved(self):
+        """write the alt text and index this comic, once its picture is on disk"""
+        with metrics.timed(self.HOST, 'write'):
+            if self.alt_text:
+                with atomic_write(self.destination_folder.joinpath(self.filename) + '.txt', 'w') as dest:
+                    dest.write(self.alt_text)
+            if self.index is not None:
+                self.index.add(self.to_record())
+            if self.gaps is not None:
+                self.gaps.discard(self.number)
         return self.destination_folder.joinpath(self.filename)
 
+    def record_failure(self, reason):
+        """queue this comic for a later retry, its download failed because of `reason`"""
+        if self.failures is not None:
+            self.failures.add(self.number, reason)
+
+    def forget_failure(self):
+        """take this comic off the failure queue, if it was there"""
+        if self.failures is not None:
+            self.failures.discard(self.number)
+
+    def record_gap(self, status):
+        """remember this comic as missing, if the collection keeps track of its gaps"""
+        if self.gaps is not None:
+            self.gaps.add(self.number, self.date_of(self.number), status)
+
+    def to_record(self):
+        """the metadata of this comic, as stored in the index"""
+        picture = self.destination_folder.joinpath(self.filename)
+        return {'number': self.number,
+                'title': self.title,
+                'image_url': self.image_url,
+                'filename': self.filename,
+                'size': picture.getsize() if picture.isfile() else None,
+                'alt_text': self.alt_text,
+                'data': self.data or None}
+
+    def load_record(self, record):
+        """restore the metadata of this comic from an index record"""
+        if record.get('data'):
+            self.data = record['data']
+
+    def remember(self):
+        """store this comic's metadata in the index, unless already there"""
+        if self.index is None or self.number in self.index:
+            return
+        if self.filename is None:
+            return  # missing comic, nothing to remember
+        self.index.add(self.to_record())
+
     @property
     @abc.abstractmethod
     def filename(self):
         """The candidate filename for this comics image"""
 
+    def known_on_disk(self, folder):
+        """true if the folder scan or the index show all this comic's pictures in `folder`"""
+        if self.on_disk(self.number) and Path(folder) == self.destination_folder:
+            return True
+        record = self.index.get(self.number) if self.index is not None else None
+        if record is None:
+            return False
+        self.load_record(record)
+        # with its metadata, the filenames are those of the current settings (language...)
+        names = self.pictures() if record.get('data') else [record['filename']]
+        return all(name is not None and Path(folder).joinpath(name).isfile() for name in names)
+
     def has_target(self, folder):
         """true if this comic can be downloaded to `output_file` inside `folder`"""
+        if self.known_on_disk(folder):
+            return False  # no need to ask the network
+        if self.filename is None:
+            return False
         target = Path(folder).joinpath(self.filename)
         if target.isfile():
             return False
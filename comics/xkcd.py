@@ -3,8 +3,8 @@
 
 import json
 
-import requests
-
+from . import net
+from .retry import HTTPStatusError
 from .webcomic import WebComic
 
 
@@ -13,13 +13,17 @@ class XKCDComic(WebComic):
 
     BASE_URL = 'http://www.xkcd.com/'
     BASE_IMG_URL = 'http://imgs.xkcd.com/comics/'
+    __slots__ = ()
     destination_folder = None
+    HOST = 'www.xkcd.com'
 
     @staticmethod
     def latest_id():
         """Return the uid of the latest comic in the collection"""
-        req = requests.get('http://xkcd.com/info.0.json')
-        num = json.loads(req.content.decode())['num']
+        url = 'http://xkcd.com/info.0.json'
+        req, num = net.get_parsed(url, lambda req: json.loads(req.content.decode())['num'])
+        if req.status_code != 200:
+            raise HTTPStatusError(url, req.status_code)
         return num
 
     @staticmethod
@@ -28,16 +32,14 @@ class XKCDComic(WebComic):
         return 1
 
     @classmethod
-    def all(cls):
-        """return an iterable of all the currently
-        available comics form this collection """
-        return [XKCDComic(num) for num in range(1, cls.latest_id() + 1)]
+    def iter_ids(cls, start=1):
+        """return an iterable of the numbers of all the currently
+        available comics form this collection, from number `start` """
+        return range(max(start, 1), cls.latest_id() + 1)
 
     def __init__(self, number):
         """Make a WebComic object"""
         super().__init__(number)
-        self.uid = number
-        self.data = ''
 
     def __str__(self):
         return "XKCD Webcomic {}: {}".format(self.number, self.title)
@@ -45,30 +47,36 @@ class XKCDComic(WebComic):
     def __repr__(self):
         return str(self)
 
-    def ensure_data(self):
-        """Make sure the data is downloaded if necessary"""
-        if self.data:
-            return
-        link = self.BASE_URL + str(self.number)
-        req = requests.get(link + '/info.0.json', timeout=10)
-        self.data = json.loads(req.content.decode())
+    def fetch_data(self):
+        """Generator of the requests needed to get the data, see `net.drive`"""
+        url = self.BASE_URL + str(self.number) + '/info.0.json'
+        req = yield url
+        if req.status_code in self.MISSING:
+            self.record_gap(req.status_code)
+            return None
+        if req.status_code != 200:
+            raise HTTPStatusError(url, req.status_code)
+        return json.loads(req.content.decode())
 
     @property
     def alt_text(self):
         """The alt text for this comic, or an empty string"""
-        self.ensure_data()
+        if not self.ensure_data():
+            return ''
         return self.data['alt']
 
     @property
     def image_url(self):
         """url of hosted image"""
-        self.ensure_data()
+        if not self.ensure_data():
+            return
         return self.data['img']
 
     @property
     def title(self):
         """title of this comic"""
-        self.ensure_data()
+        if not self.ensure_data():
+            return 'missing'
         return self.data['safe_title']
 
     @property
@@ -79,5 +87,7 @@ class XKCDComic(WebComic):
     @property
     def filename(self):
         """The candidate filename for this comics image"""
+        if not self.ensure_data():
+            return
         imgname = self.image_url.replace(self.BASE_IMG_URL, '')
         return '{:>04}-{}'.format(self.number, imgname)
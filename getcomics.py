@@ -6,24 +6,34 @@ This modules downloads all the comics from:
 In case the comics already exist on disk, skips the download, allowing to update a collection
 """
 
+import json
 import sys
+import threading
+import time
 
+from collections import Counter, OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor
-from random import shuffle
 
 import begin
 
 from path import Path
-from tqdm import tqdm
 
-from comics import SinfestComic, XKCDComic, CommitStripComic, SMBCComic
+# other modules are imported where used: listing the collections, or getting one, starts fast
+from comics import metrics, net, parsing, registry, retry
+from comics.gaps import GapCache
+from comics.scheduler import Scheduler
 
-AVAIL_COLLECTIONS = 'xkcd,sinfest,commitstrip,smbc'
-COMICCLASSES = dict(zip(AVAIL_COLLECTIONS.split(','),
-                        [XKCDComic, SinfestComic, CommitStripComic, SMBCComic]))
+AVAIL_COLLECTIONS = ','.join(registry.BUILTIN)
 
 DEFAULT_PATH = Path("~/Images/comics")
 WORKERS = 32
+CONCURRENCY = 256  # comics processed at once by the asyncio engine, as `comics.aio`
+LEASE = 300  # seconds a shard claimed from a ledger lasts, as `comics.ledger.Ledger`
+PACK_PER = 100  # comics per CBZ volume, as `comics.packing`
+ENGINES = 'threads,asyncio'
+METRICS_FORMATS = 'json,prometheus'
+ORDERS = 'oldest,newest'
+OUTCOMES = ('downloaded', 'skipped', 'missing', 'failed')
 
 
 def setup(root, subs):
@@ -40,68 +50,419 @@ def setup(root, subs):
             target.makedirs()
 
 
-def progress(futures):
+class Progress:
     """
-    Display a progress bar while futures are done
-    Works with a set of futures, or any stuff with a .done method
+    One progress bar per collection, with counts of each outcome,
+    updated as comics complete
     """
-    total = len(futures)
-    with tqdm(total=total) as pbar:
-        while futures:
-            not_yet = []
-            for fut in futures:
-                if fut.done():
-                    pbar.update(1)
-                else:
-                    not_yet.append(fut)
-            futures = not_yet
 
+    def __init__(self, classes):
+        """`classes` maps the names of the collections to their classes"""
+        from tqdm import tqdm  # slow to import, only needed for a run
+        self.names = {class_: name for name, class_ in classes.items()}
+        self.counts = {name: Counter() for name in classes}
+        self.bars = {name: tqdm(desc=name, position=position, unit='comic')
+                     for position, name in enumerate(classes)}
+        self.start = time.time()
+        self.deferred = {}  # collection: first comic left for the next run
+        self._lock = threading.Lock()
 
-def batch_submit(executor, func, items):
-    """apply `func` to all `items` with executor, and return a collection of futures"""
-    futures = []
-    for item in items:
-        fut = executor.submit(func, item)
-        futures.append(fut)
-    return futures
+    def skipped(self, comic):
+        """account for `comic`, known to be on disk without any work"""
+        self.count(comic, 'skipped')
+
+    def done(self, comic, future):
+        """
+        account for `comic`, whose download is the finished `future`.
+        Failed comics are queued for a later retry, others taken off that queue.
+        """
+        outcome = classify(comic, future)
+        if outcome == 'failed':
+            comic.record_failure(failure_reason(future))
+        else:
+            comic.forget_failure()
+        self.count(comic, outcome)
+
+    def defer(self, comic):
+        """note that `comic` (if any), and those after it in its collection, were left out"""
+        if comic is not None:
+            self.deferred.setdefault(self.names[type(comic)], comic)
+
+    def count(self, comic, outcome):
+        """add `comic` to the `outcome` count of its collection"""
+        name = self.names[type(comic)]
+        with self._lock:
+            self.counts[name][outcome] += 1
+            self.bars[name].set_postfix(self.counts[name], refresh=False)
+            self.bars[name].update(1)
+
+    def close(self):
+        """close the progress bars"""
+        for pbar in self.bars.values():
+            pbar.close()
+
+    def summary(self):
+        """the outcome counts of the run, as a dict ready for json"""
+        collections = {name: {outcome: counts[outcome] for outcome in OUTCOMES}
+                       for name, counts in self.counts.items()}
+        total = {outcome: sum(counts[outcome] for counts in collections.values())
+                 for outcome in OUTCOMES}
+        deferred = {name: {'number': comic.number, 'uid': str(comic.uid)}
+                    for name, comic in self.deferred.items()}
+        return {'collections': collections, 'total': total, 'deferred': deferred,
+                'elapsed': round(time.time() - self.start, 3)}
+
+
+def classify(comic, future):
+    """the outcome of the download of `comic`, one of OUTCOMES"""
+    if future.cancelled() or future.exception() is not None:
+        return 'failed'
+    if future.result():
+        return 'downloaded'
+    if comic.known_on_disk(comic.destination_folder):
+        return 'skipped'
+    return 'missing'
+
+
+def failure_reason(future):
+    """why the download that is the finished `future` failed, in a few words"""
+    if future.cancelled():
+        return 'cancelled'
+    error = future.exception()
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def run_threads(comics, done, func=None, stop_at=None):
+    """
+    download `comics` with a pool of WORKERS threads, fed host by host, with `func` (`process`).
+    `done` is called with each comic and its finished future. None is started after
+    `stop_at` (a `time.time()`), if given: return the comics already pulled but left out.
+    """
+    executor = ThreadPoolExecutor(max_workers=WORKERS)
+    scheduler = Scheduler(executor, func=func or process, workers=WORKERS)
+    left = scheduler.run(comics, done=done, stop_at=stop_at)
+    executor.shutdown()
+    return left
+
+
+def run_asyncio(comics, done, concurrency):
+    """download `comics` from a single thread, `concurrency` at a time, see `run_threads`"""
+    from comics import aio  # asyncio and aiohttp, only for this engine
+    aio.run(comics, concurrency=concurrency, done=done)
+    return []  # comics are pulled one at a time, `until` keeps those left out
+
+
+def interleave(*iterables):
+    """yield from all `iterables` in turn, until they are all exhausted"""
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            continue
+        yield item
+        iterators.append(iterator)
+
+
+def until(deadline, comics, late):
+    """
+    yield `comics` until the `deadline` (a `time.time()`) passes,
+    then stop and put the comic pulled in the meantime into `late`
+    """
+    for comic in comics:
+        if time.time() > deadline:
+            late.append(comic)
+            return
+        yield comic
+
+
+def to_check(class_, start, progress, stop=None, newest_first=False):
+    """
+    lazily yield the comics of `class_` worth checking, from number `start` (up to `stop`),
+    or down to `start` from the newest if `newest_first`.
+    Those already on disk are only accounted for in `progress`.
+    If the enumeration fails, it is reported and the other collections go on.
+    """
+    try:
+        comics = iter(class_.iter_comics(start, newest_first=newest_first))
+    except Exception as error:  # collections may be plugins, whatever they raise
+        enumeration_failed(progress.names[class_], error)
+        return
+    while True:
+        try:
+            with metrics.timed(class_.HOST, 'enumerate'):
+                comic = next(comics, None)
+        except Exception as error:
+            enumeration_failed(progress.names[class_], error)
+            return
+        if comic is None or stop is not None and comic.number >= stop:
+            return
+        if class_.on_disk(comic.number):
+            progress.skipped(comic)
+        elif not class_.known_gap(comic.number):
+            yield comic
+
+
+def enumeration_failed(name, error):
+    """report that the comics of collection `name` could not all be listed because of `error`"""
+    print('{}: enumeration failed, {}: {}'.format(name, type(error).__name__, error),
+          file=sys.stderr)
+
+
+def claimed(ledger, tracker, collections, progress, newest_first=False):
+    """
+    lazily yield the comics worth checking from the shards claimed in `ledger`,
+    one shard after the other, until no shard of `collections` is left
+    """
+    while True:
+        shard = ledger.claim(collections, newest_first=newest_first)
+        if shard is None:
+            return
+        class_ = registry.load(shard.collection)
+        for comic in to_check(class_, shard.start, progress, stop=shard.stop):
+            tracker.started(shard)
+            yield comic
+        tracker.exhausted(shard)
+
+
+def verified(class_, name):
+    """
+    check the pictures of `class_` on disk, set the corrupt ones aside and queue
+    their comics for a retry. Return the number of corrupt comics.
+    """
+    from comics import verify
+    folder = class_.destination_folder
+    corrupt = verify.scan(folder, class_.index, workers=WORKERS)
+    if not corrupt:
+        return 0
+    verify.quarantine(folder, corrupt)
+    for number, reasons in sorted(corrupt.items()):
+        class_.failures.add(number, 'corrupt: ' + '; '.join(
+            '{} {}'.format(filename, reason) for filename, reason in sorted(reasons.items())))
+        print('{} {}: {}'.format(name, number, ', '.join(sorted(reasons.values()))), file=sys.stderr)
+    class_.present = class_.present.difference(corrupt)
+    return len(corrupt)
+
+
+def first_to_check(class_, incremental, recheck):
+    """the number to start enumerating `class_` from"""
+    mark = class_.watermark() if incremental else None
+    if mark is None:
+        return 1
+    return max(1, mark + 1 - recheck)
 
 
 def process(comic):
     """proceed to the download of a single webcomic"""
-    comic.download()
+    return comic.download()
 
 
 @begin.start(auto_convert=True)
 def main(root_path: "The root folder for comics"=DEFAULT_PATH,
          commitstrip_lang: 'language in which to grab commitstrip {fr, en}'='fr',
-         only: 'what comics to grab, separated with commas'=AVAIL_COLLECTIONS):
+         commitstrip_enumeration: 'how to list commitstrips {archive, daily}'='archive',
+         commitstrip_all_langs: 'also get the other languages of each commitstrip, into subfolders'=False,
+         only: 'what comics to grab, separated with commas, all of them by default'='',
+         list_collections: 'print the available collections and exit'=False,
+         rebuild_index: 'rebuild metadata indexes from the files on disk first'=False,
+         incremental: 'only check comics newer than the last run'=False,
+         recheck: 'in incremental mode, also re-check this many comics before the last one'=0,
+         user_agent: 'User-Agent header sent with every request'=net.USER_AGENT,
+         http_stats: 'print connection reuse counters at the end'=False,
+         engine: 'download engine, one of {threads, asyncio}'='threads',
+         concurrency: 'comics processed at once by the asyncio engine'=CONCURRENCY,
+         chunk_size: 'bytes read at once when streaming images to disk'=net.CHUNK_SIZE,
+         http_cache: 'keep metadata pages on disk and revalidate them'=False,
+         gap_recheck_days: 'days during which a missing daily strip is probed again'=GapCache.RECHECK_DAYS,
+         cache_ttl: 'seconds during which cached pages are trusted without asking'=0,
+         summary: 'write a JSON summary of the run to this file, - for stdout'='',
+         parse_workers: 'processes parsing scraped pages, 0 to parse in the workers'=0,
+         metrics_file: 'record per-phase timings and HTTP counters into this file, - for stdout'='',
+         metrics_format: 'format of the metrics file, one of {json, prometheus}'='json',
+         profile: 'write a cProfile of the download workers to this file'='',
+         retries: 'attempts after a timeout or an overloaded server (429, 5xx)'=retry.RETRIES,
+         retry_failed: 'only retry the comics that failed in previous runs'=False,
+         dedup: 'store pictures once, by content, hardlinked into the collections'=False,
+         ledger: 'share the work with other workers through this SQLite file'='',
+         shard_size: 'comics per shard of work claimed from the ledger'=100,
+         lease: 'seconds a claimed shard is kept without news from its worker'=LEASE,
+         worker_id: 'name of this worker in the ledger, host-pid by default'='',
+         import_snapshot: 'pre-load the comics metadata from this snapshot file first'='',
+         export_snapshot: 'write the metadata of all indexed comics to this compressed file'='',
+         order: 'which comics of each collection to check first, one of {oldest, newest}'='oldest',
+         deadline: 'seconds after which no more comics are started, 0 for no limit'=0.0,
+         verify_pictures: 'check the pictures on disk, set corrupt ones aside and fetch them again'=False,
+         pack: 'append the pictures to CBZ volumes in this folder, one subfolder per collection'='',
+         pack_by: "comics per volume, or 'year' for daily strips"=str(PACK_PER)):
     """
     Download comics from the internet onto disk.
     """
 
-    collections = only.split(',')
-    comics_to_check = []
+    if list_collections:
+        for name in registry.names():
+            print('{:<16}{}'.format(name, registry.target(name)))
+        return
+    if engine not in ENGINES.split(','):
+        print(engine + ": is not a known engine, use one of " + ENGINES, file=sys.stderr)
+        exit(1)
+    if metrics_format not in METRICS_FORMATS.split(','):
+        print(metrics_format + ": is not a known metrics format, use one of " + METRICS_FORMATS,
+              file=sys.stderr)
+        exit(1)
+    if pack_by != 'year' and not pack_by.isdigit():
+        print(pack_by + ": is not a number of comics per volume, nor 'year'", file=sys.stderr)
+        exit(1)
+    if order not in ORDERS.split(','):
+        print(order + ": is not a known order, use one of " + ORDERS, file=sys.stderr)
+        exit(1)
+    enumerations = registry.load('commitstrip').ENUMERATIONS
+    if commitstrip_enumeration not in enumerations:
+        print(commitstrip_enumeration + ": is not a known enumeration, use one of "
+              + ','.join(enumerations), file=sys.stderr)
+        exit(1)
+    newest_first = order == 'newest'
+    stop_at = time.time() + deadline if deadline else None
+    root_path = Path(root_path)  # a plain string when given on the command line
+    metrics.enable(bool(metrics_file))
+    profiler = metrics.Profiler() if profile else None
+    retry.configure(retries=retries)
+    net.configure(pool_size=WORKERS, user_agent=user_agent, chunk_size=chunk_size)
+    parsing.use_pool(parse_workers)
+    if dedup:
+        from comics.blobs import BlobStore
+        from comics.webcomic import WebComic
+        WebComic.blobs = BlobStore(root_path)
+    if http_cache:
+        from comics.cache import HTTPCache
+        net.set_cache(HTTPCache(root_path.joinpath('.cache', 'http'), ttl=cache_ttl))
+    collections = only.split(',') if only else registry.names()
+    available = set(registry.names())
+    # only the requested collections are imported
+    classes = OrderedDict((col, registry.load(col)) for col in collections if col in available)
+    streams = []
+    if ledger:
+        from comics.ledger import Ledger, ShardTracker
+    shared = Ledger(ledger, owner=worker_id or None, lease=lease) if ledger else None
+    progress = Progress(classes)
 
-    dirs = [col for col in collections if col in COMICCLASSES]
     # make those directories if needed
-    setup(root=root_path, subs=dirs)
-    del dirs
+    setup(root=root_path, subs=classes)
 
     for collection in collections:
-        if collection not in COMICCLASSES:
+        if collection not in classes:
             print(collection + ": is not implemented, did you mistype?", file=sys.stderr)
             continue  # skip that
 
-        class_ = COMICCLASSES[collection]
+        class_ = classes[collection]
         # special case for commitstrip language
-        if class_ is CommitStripComic:
+        if collection == 'commitstrip':
             class_.LANG = commitstrip_lang
+            class_.ENUMERATION = commitstrip_enumeration
+            class_.ALL_LANGS = commitstrip_all_langs
         class_.set_destination(root_path.joinpath(collection))
-        comics_to_check += class_.all()
+        metrics.register(collection, class_.HOST)
+        if rebuild_index:
+            class_.rebuild_index()
+        if class_.gaps is not None:
+            class_.gaps.recheck_days = gap_recheck_days
+        if verify_pictures:
+            verified(class_, collection)
+        if retry_failed or verify_pictures:
+            streams.append(class_.failed_comics())
+        elif shared is not None:
+            first = first_to_check(class_, incremental, recheck)
+            try:
+                stop = class_.iter_ids(first).stop
+            except Exception as error:  # as in `to_check`
+                enumeration_failed(collection, error)
+                continue
+            shared.plan(collection, first, stop, shard_size)
+        else:
+            streams.append(to_check(class_, first_to_check(class_, incremental, recheck), progress,
+                                    newest_first=newest_first))
 
-    # shuffle the list to make time more predictable during download
-    shuffle(comics_to_check)
+    if import_snapshot:
+        from comics import snapshot
+        loaded = snapshot.load(import_snapshot, classes)
+        print('snapshot: ' + ', '.join('{} {}'.format(count, name) for name, count in loaded.items()),
+              file=sys.stderr)
 
-    executor = ThreadPoolExecutor(max_workers=WORKERS)
-    futures = batch_submit(executor, func=process, items=comics_to_check)
-    progress(futures)
+    # interleave the collections to make time more predictable during download,
+    # comics are only made as the workers need them
+    comics_to_check = interleave(*streams)
+    done = progress.done
+    if shared is not None and not (retry_failed or verify_pictures):
+        # or claim shards of work from the ledger, as long as there are some
+        tracker = ShardTracker(shared)
+        comics_to_check = claimed(shared, tracker, list(classes), progress,
+                                  newest_first=newest_first)
+
+        def done(comic, future):
+            progress.done(comic, future)
+            tracker.finished(progress.names[type(comic)], comic.number)
+        shared.start_heartbeat()
+    late = []
+    if stop_at is not None:
+        comics_to_check = until(stop_at, comics_to_check, late)
+
+    try:
+        if engine == 'asyncio':
+            run = run_asyncio if profiler is None else profiler.wrap(run_asyncio)
+            left = run(comics_to_check, done, concurrency)
+        else:
+            left = run_threads(comics_to_check, done, stop_at=stop_at,
+                               func=None if profiler is None else profiler.wrap(process))
+        if stop_at is not None:
+            # in enumeration order: pulled but not started, pulled past the deadline, not pulled
+            for comic in left + late + [next(stream, None) for stream in streams]:
+                progress.defer(comic)
+    finally:
+        progress.close()
+        if profiler is not None:
+            profiler.dump(profile)
+        if shared is not None:
+            shared.close()
+
+    if progress.deferred:
+        print('deadline reached, left for the next run: ' + ', '.join(
+            '{} from {}'.format(name, comic.uid) for name, comic in sorted(progress.deferred.items())),
+            file=sys.stderr)
+
+    for collection, class_ in classes.items():
+        # newest first, what is left is older than what is on disk: keep the previous watermark
+        if not (newest_first and collection in progress.deferred):
+            class_.update_watermark()
+
+    if pack:
+        from comics import packing
+        for collection, class_ in classes.items():
+            added = packing.pack(class_, Path(pack).expand().joinpath(collection),
+                                 collection, per=pack_by if pack_by == 'year' else int(pack_by))
+            print('{}: {} pictures packed'.format(collection, added), file=sys.stderr)
+
+    if export_snapshot:
+        from comics import snapshot
+        snapshot.export(export_snapshot, classes)
+
+    if http_stats:
+        print('{requests} requests, {connections} connections opened, {reused} reused'.format(
+            **net.stats()), file=sys.stderr)
+
+    if summary:
+        report = progress.summary()
+        report['http'] = net.stats()
+        if summary == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(summary, 'w') as dest:
+                json.dump(report, dest, indent=2)
+
+    if metrics_file:
+        dump = metrics.to_json() if metrics_format == 'json' else metrics.to_prometheus()
+        if metrics_file == '-':
+            print(dump)
+        else:
+            with open(metrics_file, 'w') as dest:
+                dest.write(dump)